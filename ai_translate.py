@@ -1,27 +1,36 @@
-import itertools
+import hashlib
 import json
+import os
 import sys
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import TypedDict
 
 import json_repair
-from chromadb import Settings
-from langchain_chroma import Chroma
 from langchain_core.documents import Document
 from langchain_core.prompts import PromptTemplate
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import START, StateGraph
-from pydantic import SecretStr
 
-from config import openai_embed_base_url, openai_api_key, openai_embed_model, openai_llm_base_url, openai_llm_model
+from async_engine import AdaptiveLimiter, RateBudget, run_chunks_async
+from config import openai_embed_model, openai_embed_dimensions, \
+    TRANSLATE_ENGINE, ASYNC_INITIAL_CONCURRENCY, ASYNC_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, \
+    CHUNK_TOKEN_BUDGET, CHUNK_MAX_OUTPUT_TOKENS, REF_MERGED_MAP_FILE, GLOSSARY_LLM_FALLBACK, VECTOR_BACKEND, VECTOR_MMAP_DTYPE, \
+    CONTEXT_TOKEN_BUDGET, VALIDATION_MAX_ATTEMPTS, VERBOSE_OUTPUT, TEMPLATE_FACTORING
+from context_builder import build_context
+from glossary import load_glossary
+from journal import write_text_atomic
+from metrics import metrics
+from resources import get_llm, get_vectorstore, pool_stats, run_coroutine
+from retrieval import collect_candidates, collect_string_values, invalidate_search_cache, search_cache
+from scheduler import pack_scheduled_chunks
+from templates import TemplateFactoring
+from token_budget import estimate_tokens
+from vector_index import export_vector_index, mmap_index_stale
+from translation_store import TranslationStore
+from translation_memory import dedup_values, fan_out
+from validation import make_validated
 
 
-def chunk_dict(d, size=100):
-    """将字典按 size 分组，返回一个生成器"""
-    items = iter(d.items())
-    for _ in range(0, len(d), size):
-        yield dict(itertools.islice(items, size))
-
 def chunk_list(lst, chunk_size):
     """
     将一个大列表分割成多个小块，每个小块的大小为 chunk_size。
@@ -33,40 +42,230 @@ def chunk_list(lst, chunk_size):
     for i in range(0, len(lst), chunk_size):
         yield lst[i:i + chunk_size]
 
-def load_translate_embed(db_dir="chroma"):
-    embeddings = OpenAIEmbeddings(base_url=openai_embed_base_url, api_key=SecretStr(openai_api_key), model=openai_embed_model, dimensions=768, check_embedding_ctx_length=False)
-    return Chroma(collection_name="langchain", embedding_function=embeddings, persist_directory=db_dir, client_settings=Settings(is_persistent=True))
+def run_translate_chunks(translate, chunks, max_workers, on_result):
+    """
+    在线程池中翻译所有分块，每个分块完成后调用 on_result，
+    单个分块失败不会影响其他分块，中断时取消还未开始的分块
+    :return: 失败的分块数量
+    """
+    failed = 0
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [executor.submit(translate, chunk) for chunk in chunks]
+        pending = len(futures)
+        metrics.set_gauge("queue_depth", pending)
+        for future in as_completed(futures):
+            pending -= 1
+            metrics.set_gauge("queue_depth", pending)
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                metrics.inc("chunks_failed")
+                print(f"分块翻译失败: {e}")
+                continue
+            metrics.inc("chunks_completed")
+            on_result(result)
+            metrics.maybe_export()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        metrics.export()
+    return failed
+
+def run_translate_chunks_async(atranslate, chunks, on_result):
+    """
+    使用异步引擎翻译所有分块，并发数根据延迟和 429/5xx 自适应调整，
+    并遵守配置的每分钟请求数和 token 数预算
+    :return: 失败的分块数量
+    """
+    limiter = AdaptiveLimiter(ASYNC_INITIAL_CONCURRENCY, 1, ASYNC_MAX_CONCURRENCY)
+    budget = RateBudget(LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+
+    def cost_fn(chunk):
+        # 输入加上大致等长的输出
+        return estimate_tokens(json.dumps(chunk, ensure_ascii=False)) * 2
+
+    return run_coroutine(run_chunks_async(atranslate, list(chunks), on_result, limiter, budget, cost_fn))
+
+def dispatch_translate_chunks(translate, atranslate, chunks, max_workers, on_result, engine=None):
+    """根据 engine (thread / async) 选择线程池或异步引擎"""
+    if (engine or TRANSLATE_ENGINE) == "async":
+        return run_translate_chunks_async(atranslate, chunks, on_result)
+    return run_translate_chunks(translate, chunks, max_workers, on_result)
+
+def record_usage(messages, response_text, usage=None):
+    """记录请求数和 token 数，接口没有返回用量时按文本估算"""
+    if usage:
+        prompt_tokens, completion_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    else:
+        prompt_tokens, completion_tokens = estimate_tokens(messages.to_string()), estimate_tokens(response_text)
+    metrics.inc("llm_requests")
+    metrics.inc("prompt_tokens", prompt_tokens)
+    metrics.inc("completion_tokens", completion_tokens)
+
+def stream_text(llm, messages):
+    response_text = ""
+    usage = None
+    for delta in llm.stream(messages):
+        response_text += delta.content
+        usage = delta.usage_metadata or usage
+    record_usage(messages, response_text, usage)
+    return response_text
+
+async def astream_text(llm, messages):
+    response_text = ""
+    usage = None
+    async for delta in llm.astream(messages):
+        response_text += delta.content
+        usage = delta.usage_metadata or usage
+    record_usage(messages, response_text, usage)
+    return response_text
+
+def llm_node(name, llm, build_messages, parse, allm=None):
+    """
+    创建同时支持 invoke 和 ainvoke 的大模型节点
+    :param build_messages: state -> prompt 消息
+    :param parse: 模型输出文本 -> state 更新
+    :param allm: ainvoke 使用的客户端，默认与 llm 相同
+    """
+    def func(state):
+        with metrics.span(name):
+            return parse(stream_text(llm, build_messages(state)))
+
+    async def afunc(state):
+        with metrics.span(name):
+            return parse(await astream_text(allm or llm, build_messages(state)))
+
+    return name, RunnableLambda(func, afunc=afunc, name=name)
+
+def glossary_node(llm, extract_messages, get_text, allm=None):
+    """
+    术语匹配节点：用本地术语表一次扫描找出文本中所有已知术语，直接作为翻译参考，
+    未被术语覆盖的专有名词交给向量检索；开启 GLOSSARY_LLM_FALLBACK 时，
+    存在未匹配的专有名词才会调用大模型提取关键词
+    """
+    glossary = load_glossary(REF_MERGED_MAP_FILE)
+
+    def match(state):
+        with metrics.span("match_terms") as attrs:
+            text = get_text(state)
+            references, covered = glossary.match(text)
+            unmatched = glossary.unmatched_proper_nouns(text, covered)
+            attrs.update(glossary=len(references), unmatched=len(unmatched))
+        metrics.inc("glossary_matches", len(references))
+        return references, unmatched
+
+    def func(state):
+        references, unmatched = match(state)
+        if unmatched and GLOSSARY_LLM_FALLBACK:
+            with metrics.span("extract_keywords"):
+                unmatched = stream_text(llm, extract_messages(state)).splitlines()
+        return {"glossary": references, "words_to_search": unmatched}
+
+    async def afunc(state):
+        references, unmatched = match(state)
+        if unmatched and GLOSSARY_LLM_FALLBACK:
+            with metrics.span("extract_keywords"):
+                unmatched = (await astream_text(allm or llm, extract_messages(state))).splitlines()
+        return {"glossary": references, "words_to_search": unmatched}
+
+    return "match_terms", RunnableLambda(func, afunc=afunc, name="match_terms")
+
+def parse_json_answer(answer: str):
+    return json_repair.loads(answer.removeprefix('```json\n').removesuffix('\n```').strip())
+
+def load_translate_embed(db_dir="chroma", backend=None):
+    """
+    加载参考索引，backend 为 chroma 时使用 Chroma，为 mmap 时使用导出的内存映射向量矩阵，
+    同一进程内共享同一个实例
+    """
+    return get_vectorstore(db_dir, backend)
+
+def load_embed_manifest(manifest_file):
+    """
+    读取向量索引清单，嵌入模型或维度变化时视为空清单，强制全部重建
+    """
+    if os.path.exists(manifest_file):
+        with open(manifest_file, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("embed_model") == openai_embed_model and manifest.get("dimensions") == openai_embed_dimensions:
+            return manifest["documents"]
+    return {}
+
+def save_embed_manifest(manifest_file, documents):
+    # 内容哈希作为索引版本，检索缓存据此判断是否失效
+    content_hash = hashlib.sha1(json.dumps(sorted(documents.items()), ensure_ascii=False).encode("utf-8")).hexdigest()
+    tmp_file = manifest_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump({"embed_model": openai_embed_model, "dimensions": openai_embed_dimensions, "content_hash": content_hash, "documents": documents}, f, ensure_ascii=False)
+    os.replace(tmp_file, manifest_file)
 
 def build_translate_embed(merged_en2zh_file, db_dir="chroma"):
     # 1. 读取 JSON 文件
     with open(merged_en2zh_file, "r", encoding="utf-8") as f:
         translation_map = json.load(f)
 
-    # 2. 格式化为 key=value 字符串
+    # 2. 格式化为 key=value 字符串，并计算内容哈希
     documents = [Document(f"{key}={value}", id=key) for key, value in translation_map.items() if len(key) > 0]
-
-    # 3. 删除已存在的术语
-    vector_storage = load_translate_embed(db_dir)
-    ids = [doc.id for doc in documents]
-    vector_storage.delete(ids)
-
-    # 4. 添加新的术语
-    for chunk in chunk_list(documents, 4096):
+    hashes = {doc.id: hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest() for doc in documents}
+
+    # 3. 与上次构建的清单对比，找出新增、变化和消失的术语
+    vector_storage = load_translate_embed(db_dir, backend="chroma")
+    manifest_file = os.path.join(db_dir, "manifest.json")
+    manifest = load_embed_manifest(manifest_file)
+    changed = [doc for doc in documents if manifest.get(doc.id) != hashes[doc.id]]
+    removed = [doc_id for doc_id in manifest if doc_id not in hashes]
+    print(f"向量索引: 新增或变化 {len(changed)}, 删除 {len(removed)}, 跳过 {len(documents) - len(changed)}")
+
+    # 4. 删除消失的术语
+    for chunk in chunk_list(removed, 4096):
+        vector_storage.delete(chunk)
+        for doc_id in chunk:
+            del manifest[doc_id]
+    if removed:
+        save_embed_manifest(manifest_file, manifest)
+
+    # 5. 写入新增和变化的术语，每批完成后更新清单，中断后可以继续
+    for chunk in chunk_list(changed, 4096):
         vector_storage.add_documents(chunk)
+        for doc in chunk:
+            manifest[doc.id] = hashes[doc.id]
+        save_embed_manifest(manifest_file, manifest)
+    invalidate_search_cache()
 
-    return vector_storage
+    # 6. 导出内存映射向量矩阵
+    mmap_dir = os.path.join(db_dir, "mmap")
+    if VECTOR_BACKEND == "mmap" and (changed or removed or mmap_index_stale(mmap_dir, VECTOR_MMAP_DTYPE)):
+        export_vector_index(vector_storage, mmap_dir, VECTOR_MMAP_DTYPE)
 
-def retrieve_related_words(vectorstore, search_keywords):
-    retrieved_docs = list()
-    for word in search_keywords:
-        docs = vectorstore.similarity_search(word, k=5)
-        retrieved_docs.append("\n".join([doc.page_content for doc in docs]))
-    return "\n".join(retrieved_docs)
+    return vector_storage
 
-def translate_json(untranslated_file, output_file, db_dir="chroma", max_workers=8):
+def report_validation_failures(failures: dict, source: dict, failed_file=None):
+    """
+    输出最终校验失败的条目，指定 failed_file 时写入 key -> {原因, 原文}，没有失败时删除旧文件
+    """
+    if not failures:
+        if failed_file and os.path.exists(failed_file):
+            os.remove(failed_file)
+        return
+    reasons = {}
+    for reason in failures.values():
+        reasons[reason] = reasons.get(reason, 0) + 1
+    print(f'⚠️ 校验失败条目: {len(failures)}, 原因: {reasons}')
+    if failed_file:
+        report = {key: {'reason': reason, 'source': source.get(key)} for key, reason in sorted(failures.items())}
+        write_text_atomic(failed_file, json.dumps(report, ensure_ascii=False, indent=2))
+        print(f'校验失败的条目已写入 {failed_file}')
+
+def build_json_translator(db_dir="chroma"):
+    """
+    构建 key -> 英文 的批量翻译流程：检索参考 -> 生成译文，返回 (translate, atranslate)
+    """
     vectorstore = load_translate_embed(db_dir)
 
-    llm = ChatOpenAI(base_url=openai_llm_base_url, api_key=SecretStr(openai_api_key), model=openai_llm_model, temperature=0)
+    llm = get_llm(temperature=0)
+    # 异步引擎自己处理 429 并调整并发，客户端不再重试，否则限流对自适应并发不可见
+    allm = get_llm(temperature=0, max_retries=0)
 
     prompt = PromptTemplate.from_template("""
 <task>
@@ -86,24 +285,21 @@ def translate_json(untranslated_file, output_file, db_dir="chroma", max_workers=
     # Define state for application
     class State(TypedDict):
         question: dict
-        context: set[str]
+        context: list[str]
         answer: str
 
     # Define application steps
+    @metrics.timed("retrieve")
     def retrieve(state: State):
-        retrieved_docs = set()
-        for word in state["question"].values():
-            docs = vectorstore.similarity_search(word, k=3)
-            retrieved_docs.update([doc.page_content for doc in docs])
-        return {"context": retrieved_docs}
+        values = list(state["question"].values())
+        candidates = collect_candidates(vectorstore, values, k=3)
+        return {"context": build_context(candidates, values, CONTEXT_TOKEN_BUDGET)}
 
-    def generate(state: State):
+    def generate_messages(state: State):
         docs_content = "\n".join(state["context"])
-        messages = prompt.invoke({"question": json.dumps(state["question"], ensure_ascii=False, indent=2), "context": docs_content})
-        response_text = ""
-        for delta in llm.stream(messages):
-            response_text += delta.content
-        return {"answer": response_text}
+        return prompt.invoke({"question": json.dumps(state["question"], ensure_ascii=False, indent=2), "context": docs_content})
+
+    generate = llm_node("generate", llm, generate_messages, lambda text: {"answer": text}, allm)
 
     # Compile application and test
     graph_builder = StateGraph(State).add_sequence([retrieve, generate])
@@ -111,34 +307,114 @@ def translate_json(untranslated_file, output_file, db_dir="chroma", max_workers=
     graph = graph_builder.compile()
 
     def translate(msg: dict):
-        answer: str = graph.invoke({"question": msg}).get("answer")
-        return json_repair.loads(answer.removeprefix('```json\n').removesuffix('\n```').strip())
+        return parse_json_answer(graph.invoke({"question": msg}).get("answer"))
 
-    with open(untranslated_file, "r", encoding="utf-8") as f:
-        untranslated = json.load(f)
+    async def atranslate(msg: dict):
+        return parse_json_answer((await graph.ainvoke({"question": msg})).get("answer"))
 
-    results = {}
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        for chunk in chunk_dict(untranslated, 100):
-            future = executor.submit(translate, chunk)
-            futures.append(future)
+    return translate, atranslate
 
-        for future in as_completed(futures):
-            result = future.result()
+def translate_pending(pending: dict, translate, atranslate, max_workers, on_translated, engine=None, namespaces=None, memory=None, on_composed=None):
+    """
+    合并相同的原文后分块翻译，逐键校验并重试失败的键，
+    每个分块完成后把译文分发回所有相同原文的键，调用 on_translated(key -> 中文)
+    :param namespaces: 已知的 key -> 命名空间，用于组成分块
+    :param memory: 英文 -> 中文 的翻译记忆，用于模板的填充词
+    :param on_composed: 接收由模板组合出的译文，默认与 on_translated 相同
+    :return: (失败的分块数, 最终校验失败的 key -> 原因)
+    """
+    # 只差一个词（木材、颜色、金属、等级）的条目族只翻译一次模板，在本地组合译文
+    factoring = None
+    if TEMPLATE_FACTORING:
+        factoring = TemplateFactoring(pending)
+        if factoring.families:
+            factoring.resolve_fillers(translate, memory or {}, VALIDATION_MAX_ATTEMPTS)
+            pending = {**factoring.rest, **factoring.template_entries()}
+            print(f'模板: {len(factoring.templates)}, 覆盖条目: {factoring.entry_count()}, 填充词: {len(factoring.filler_translations)}')
+
+    unique, groups = dedup_values(pending)
+    print(f'待翻译: {len(pending)}, 去重后: {len(unique)}')
+
+    def on_result(result):
+        if VERBOSE_OUTPUT:
             json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
             print()
-            results.update(result)
-            processed = len(results)
-            print(f'{processed} / {len(untranslated)}')
-
-    results = dict(sorted(results.items()))
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
-
-def translate_document(input_document, db_dir="chroma"):
+        if factoring:
+            composed = factoring.compose(result)
+            if composed:
+                (on_composed or on_translated)(composed)
+        on_translated(fan_out(result, unique, groups))
+
+    # 逐键校验模型输出，只把失败的键重新翻译，最终仍失败的键不写入结果
+    failures = {}
+    translate, atranslate = make_validated(translate, atranslate, failures, VALIDATION_MAX_ATTEMPTS)
+
+    def run(entries):
+        nonlocal unique, groups
+        unique, groups = dedup_values(entries)
+        chunks = pack_scheduled_chunks(unique, CHUNK_TOKEN_BUDGET, CHUNK_MAX_OUTPUT_TOKENS, CONTEXT_TOKEN_BUDGET, namespaces=namespaces)
+        return dispatch_translate_chunks(translate, atranslate, chunks, max_workers, on_result, engine)
+
+    failed = run(pending)
+
+    # 模板翻译失败或组合后校验失败的条目退回单独翻译
+    final_failures = {}
+    if factoring and factoring.templates:
+        fallback = factoring.fallback(failures)
+        final_failures = {key: reason for rep_key, reason in failures.items() for key in groups[unique[rep_key]]}
+        failures.clear()
+        if fallback:
+            print(f'模板组合失败，单独翻译: {len(fallback)}')
+            failed += run(fallback)
+
+    print(f'检索缓存: {search_cache.stats()}, 连接池: {pool_stats()}')
+    print(f'阶段统计: {metrics.summary()}')
+    final_failures.update({key: reason for rep_key, reason in failures.items() for key in groups[unique[rep_key]]})
+    return failed, final_failures
+
+def translate_store(store: TranslationStore, scope="pack", db_dir="chroma", max_workers=8, engine=None):
+    """
+    翻译存储中未翻译和上次失败的条目：先在数据库中应用翻译记忆，
+    每个分块的译文立即写入存储，中断后重新运行只翻译剩余的条目
+    """
+    translate, atranslate = build_json_translator(db_dir)
+
+    memory_hits = store.apply_memory(scope)
+    metrics.inc("memory_hits", memory_hits)
+    pending = store.pending(scope)
+    print(f'翻译记忆命中: {memory_hits}')
+
+    done = 0
+
+    def on_translated(expanded):
+        nonlocal done
+        store.save_translations(scope, expanded, "llm")
+        done += len(expanded)
+        print(f'{done} / {len(pending)}')
+
+    # 模板组合的译文单独标记来源，方便审校
+    def on_composed(composed):
+        nonlocal done
+        store.save_translations(scope, composed, "template")
+        done += len(composed)
+        print(f'{done} / {len(pending)}')
+
+    failed, failures = translate_pending(pending, translate, atranslate, max_workers, on_translated, engine, store.pending_namespaces(scope),
+                                         store.translation_map("reference"), on_composed)
+    store.mark_failed(scope, failures)
+    report_validation_failures(failures, pending)
+    print(f'翻译存储: {store.stats(scope)}')
+    if failed or failures:
+        print(f'⚠️ {failed} 个分块翻译失败，{len(failures)} 个条目校验失败，重新运行将只翻译这些条目')
+
+def build_document_graph(db_dir="chroma"):
+    """
+    构建文档翻译流程：匹配术语 -> 检索参考 -> 生成译文，
+    返回的图可以被多个文档复用，同时支持 invoke 和 ainvoke
+    """
     vectorstore = load_translate_embed(db_dir)
-    llm = ChatOpenAI(base_url=openai_llm_base_url, api_key=SecretStr(openai_api_key), model=openai_llm_model, temperature=0, max_retries=10)
+    llm = get_llm(temperature=0, max_retries=10)
+    allm = get_llm(temperature=0, max_retries=0)
 
     extract_prompt = PromptTemplate.from_template("""
 <task>
@@ -177,44 +453,52 @@ def translate_document(input_document, db_dir="chroma"):
     # Define state for application
     class State(TypedDict):
         input_document: str
+        glossary: list[str]
         words_to_search: list[str]
-        context: set[str]
+        context: list[str]
         answer: str
 
-    def extract_keywords(state: State):
-        query = state["input_document"]
-        messages = extract_prompt.invoke({"input_document": query})
-        response_text = ""
-        for delta in llm.stream(messages):
-            response_text += delta.content
-        words = response_text.splitlines()
-        return {"words_to_search": words}
+    match_terms = glossary_node(
+        llm,
+        lambda state: extract_prompt.invoke({"input_document": state["input_document"]}),
+        lambda state: state["input_document"],
+        allm,
+    )
 
     # Define application steps
+    @metrics.timed("retrieve")
     def retrieve(state: State):
-        retrieved_docs = set()
-        for word in state["words_to_search"]:
-            docs = vectorstore.similarity_search(word, k=5)
-            retrieved_docs.update([doc.page_content for doc in docs])
-        return {"context": retrieved_docs}
+        candidates = dict.fromkeys(state["glossary"], 1.0)
+        collect_candidates(vectorstore, state["words_to_search"], 5, candidates)
+        return {"context": build_context(candidates, [state["input_document"]], CONTEXT_TOKEN_BUDGET)}
 
-    def generate(state: State):
+    def generate_messages(state: State):
         docs_content = "\n".join(state["context"])
-        messages = prompt.invoke({"input_document": state["input_document"], "context": docs_content})
-        response_text = ""
-        for delta in llm.stream(messages):
-            response_text += delta.content
-        return {"answer": response_text}
-
-    graph_builder = StateGraph(State).add_sequence([extract_keywords, retrieve, generate])
-    graph_builder.add_edge(START, "extract_keywords")
-    graph = graph_builder.compile()
+        return prompt.invoke({"input_document": state["input_document"], "context": docs_content})
+
+    generate = llm_node("generate", llm, generate_messages, lambda text: {"answer": text}, allm)
+
+    graph_builder = StateGraph(State).add_sequence([match_terms, retrieve, generate])
+    graph_builder.add_edge(START, "match_terms")
+    return graph_builder.compile()
+
+def translate_document(input_document, db_dir="chroma", graph=None):
+    graph = graph or build_document_graph(db_dir)
     answer = graph.invoke({"input_document": input_document}).get("answer")
     return answer.removeprefix('```markdown\n').removesuffix('\n```').strip()
 
-def translate_dict(untranslated: dict, db_dir="chroma", max_workers=8):
+async def atranslate_document(input_document, graph):
+    answer = (await graph.ainvoke({"input_document": input_document})).get("answer")
+    return answer.removeprefix('```markdown\n').removesuffix('\n```').strip()
+
+def build_dict_translator(db_dir="chroma"):
+    """
+    构建语言文件翻译流程：匹配术语 -> 检索参考 -> 生成译文，
+    返回 (translate, atranslate)，可以在多个文件之间共享
+    """
     vectorstore = load_translate_embed(db_dir)
-    llm = ChatOpenAI(base_url=openai_llm_base_url, api_key=SecretStr(openai_api_key), model=openai_llm_model)
+    llm = get_llm()
+    allm = get_llm(max_retries=0)
 
     extract_prompt = PromptTemplate.from_template("""
 <task>
@@ -255,76 +539,42 @@ def translate_dict(untranslated: dict, db_dir="chroma", max_workers=8):
     # Define state for application
     class State(TypedDict):
         question: dict
+        glossary: list[str]
         words_to_search: list[str]
-        context: set[str]
+        context: list[str]
         answer: str
 
-    def extract_keywords(state: State):
-        query = state["question"]
-        query_values = []
-        for value in query.values():
-            if isinstance(value, str):
-                query_values.append(value)
-            elif isinstance(value, list):
-                query_values.extend(value)
+    def extract_messages(state: State):
+        query_values = collect_string_values(state["question"])
         search_document = json.dumps(query_values, ensure_ascii=False)
-        messages = extract_prompt.invoke({"input_document": search_document})
-        response_text = ""
-        for delta in llm.stream(messages):
-            response_text += delta.content
-        words = response_text.splitlines()
-        return {"words_to_search": words}
+        return extract_prompt.invoke({"input_document": search_document})
+
+    match_terms = glossary_node(llm, extract_messages, lambda state: "\n".join(collect_string_values(state["question"])), allm)
 
     # Define application steps
+    @metrics.timed("retrieve")
     def retrieve(state: State):
-        retrieved_docs = set()
-        for chunk in chunk_dict(state["question"], 10):
-            docs = []
-            for key, value in chunk.items():
-                if isinstance(value, str):
-                    s_docs = vectorstore.similarity_search(value, k=2)
-                    docs.extend(s_docs)
-                elif isinstance(value, list):
-                    for content in value:
-                        s_docs = vectorstore.similarity_search(content, k=2)
-                        docs.extend(s_docs)
-            retrieved_docs.update([doc.page_content for doc in docs])
-        for word in state["words_to_search"]:
-            docs = vectorstore.similarity_search(word, k=5)
-            retrieved_docs.update([doc.page_content for doc in docs])
-        return {"context": retrieved_docs}
-
-    def generate(state: State):
+        values = collect_string_values(state["question"])
+        candidates = dict.fromkeys(state["glossary"], 1.0)
+        collect_candidates(vectorstore, values, 2, candidates)
+        collect_candidates(vectorstore, state["words_to_search"], 5, candidates)
+        return {"context": build_context(candidates, values, CONTEXT_TOKEN_BUDGET)}
+
+    def generate_messages(state: State):
         docs_content = "\n".join(state["context"])
-        query = state["question"]
-        input_document = json.dumps(query, ensure_ascii=False)
-        messages = prompt.invoke({"input_document": input_document, "context": docs_content})
-        response_text = ""
-        for delta in llm.stream(messages):
-            response_text += delta.content
-        return {"answer": response_text}
-
-    graph_builder = StateGraph(State).add_sequence([extract_keywords, retrieve, generate])
-    graph_builder.add_edge(START, "extract_keywords")
+        input_document = json.dumps(state["question"], ensure_ascii=False)
+        return prompt.invoke({"input_document": input_document, "context": docs_content})
+
+    generate = llm_node("generate", llm, generate_messages, lambda text: {"answer": text}, allm)
+
+    graph_builder = StateGraph(State).add_sequence([match_terms, retrieve, generate])
+    graph_builder.add_edge(START, "match_terms")
     graph = graph_builder.compile()
 
     def translate(msg: dict):
-        answer: str = graph.invoke({"question": msg}).get("answer")
-        return json_repair.loads(answer.removeprefix('```json\n').removesuffix('\n```').strip())
-
-    results = {}
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        for chunk in chunk_dict(untranslated, 100):
-            future = executor.submit(translate, chunk)
-            futures.append(future)
+        return parse_json_answer(graph.invoke({"question": msg}).get("answer"))
 
-        for future in as_completed(futures):
-            result = future.result()
-            json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
-            print()
-            results.update(result)
-            processed = len(results)
-            print(f'{processed} / {len(untranslated)}')
+    async def atranslate(msg: dict):
+        return parse_json_answer((await graph.ainvoke({"question": msg})).get("answer"))
 
-    return results
\ No newline at end of file
+    return translate, atranslate
@@ -0,0 +1,171 @@
+import asyncio
+import random
+import time
+
+from metrics import metrics
+
+
+def is_overload_error(e: Exception):
+    """判断异常是否为限流 (429) 或服务端错误 (5xx)，这类错误应当降速后重试"""
+    status_code = getattr(e, "status_code", None)
+    if status_code is None:
+        response = getattr(e, "response", None)
+        status_code = getattr(response, "status_code", None)
+    return status_code == 429 or (isinstance(status_code, int) and status_code >= 500)
+
+def retry_delay(e: Exception, attempt: int, max_delay=60.0):
+    """优先使用服务端返回的 Retry-After，否则指数退避并加入随机抖动"""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return min(max_delay, float(retry_after))
+        except ValueError:
+            pass
+    return min(max_delay, 2 ** attempt) * (0.5 + random.random())
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 自适应并发限制：
+    请求成功且延迟正常时并发上限加性增长，遇到 429/5xx 时减半，延迟明显变高时小幅下降。
+    同一次拥塞中并发的请求会同时失败，只有在上次减半之后发出的请求失败才会再次减半
+    """
+
+    def __init__(self, initial=8, min_limit=1, max_limit=64, latency_tolerance=2.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.base_latency = None
+        self._last_decrease = float('-inf')
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency: float, size: float = 1.0):
+        # 按请求规模归一化延迟，避免大分块被误判为拥塞
+        normalized = latency / max(size, 1.0)
+        if self.base_latency is None or normalized < self.base_latency:
+            self.base_latency = normalized
+        if normalized > self.base_latency * self.latency_tolerance:
+            self.limit = max(self.min_limit, self.limit * 0.9)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def on_overload(self, started: float):
+        """
+        :param started: 失败请求的发出时间 (time.monotonic)
+        """
+        if started < self._last_decrease:
+            return
+        self.limit = max(self.min_limit, self.limit * 0.5)
+        self._last_decrease = time.monotonic()
+
+
+class RateBudget:
+    """
+    每分钟请求数和每分钟 token 数的令牌桶，值为 0 表示不限制
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    async def acquire(self, tokens: int):
+        async with self._lock:
+            if self.tokens_per_minute:
+                tokens = min(tokens, self.tokens_per_minute)
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.requests_per_minute and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+                if self.tokens_per_minute and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.requests_per_minute:
+                self._requests -= 1
+            if self.tokens_per_minute:
+                self._tokens -= tokens
+
+
+async def run_chunks_async(atranslate, chunks, on_result, limiter: AdaptiveLimiter, budget: RateBudget, cost_fn, max_attempts=6):
+    """
+    并发执行所有分块的异步翻译，并发数由 limiter 自适应调整，
+    限流和服务端错误会降低并发并退避重试
+    :return: 失败的分块数量
+    """
+
+    async def worker(chunk):
+        cost = cost_fn(chunk)
+        for attempt in range(max_attempts):
+            await budget.acquire(cost)
+            async with limiter:
+                start = time.monotonic()
+                try:
+                    result = await atranslate(chunk)
+                except Exception as e:
+                    if not is_overload_error(e) or attempt == max_attempts - 1:
+                        raise
+                    limiter.on_overload(start)
+                    metrics.inc("retries")
+                    delay = retry_delay(e, attempt)
+                    print(f"请求被限流或服务端错误，{delay:.1f} 秒后重试，当前并发上限: {int(limiter.limit)}")
+                else:
+                    limiter.on_success(time.monotonic() - start, cost / 1000)
+                    return result
+                finally:
+                    metrics.set_gauge("in_flight", limiter.in_flight)
+                    metrics.set_gauge("concurrency_limit", int(limiter.limit))
+            await asyncio.sleep(delay)
+
+    failed = 0
+    tasks = [asyncio.create_task(worker(chunk)) for chunk in chunks]
+    pending = len(tasks)
+    metrics.set_gauge("queue_depth", pending)
+    try:
+        for task in asyncio.as_completed(tasks):
+            pending -= 1
+            metrics.set_gauge("queue_depth", pending)
+            try:
+                result = await task
+            except Exception as e:
+                failed += 1
+                metrics.inc("chunks_failed")
+                print(f"分块翻译失败: {e}")
+                continue
+            metrics.inc("chunks_completed")
+            on_result(result)
+            metrics.maybe_export()
+    finally:
+        for task in tasks:
+            task.cancel()
+        metrics.export()
+    return failed
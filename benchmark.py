@@ -0,0 +1,253 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import time
+import zipfile
+
+import config
+from fake_openai import FakeOpenAIServer
+from pipeline import git_revision
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+WORDS = ['copper', 'iron', 'crystal', 'energy', 'fluix', 'quartz', 'storage', 'cell', 'drive', 'matter', 'cable', 'bus',
+         'import', 'export', 'terminal', 'crafting', 'pattern', 'processor', 'inscriber', 'charger', 'growth', 'accelerator',
+         'gear', 'plate', 'rod', 'wire', 'dust', 'ingot', 'block', 'machine', 'generator', 'reactor', 'turbine', 'pump']
+TEMPLATES = ['{A} {B}', '{A} {B} {C}', 'Stores up to %s items', '§a{A} {B}§r', 'Requires {A} {B} to operate',
+             'Right-click with a {A} to craft a {B}', '%1$s of %2$s {B} used', 'Press {0} to open the {A} {B}']
+
+
+def synthetic_text(rng: random.Random):
+    """随机生成模组风格的英文文本，包含占位符和颜色代码"""
+    template = rng.choice(TEMPLATES)
+    return template.replace('{A}', rng.choice(WORDS).title()).replace('{B}', rng.choice(WORDS)).replace('{C}', rng.choice(WORDS))
+
+def synthetic_lang(rng: random.Random, namespace, keys, duplicate_rate):
+    lang = {}
+    seen = []
+    for i in range(keys):
+        if seen and rng.random() < duplicate_rate:
+            value = rng.choice(seen)
+        else:
+            value = synthetic_text(rng)
+            seen.append(value)
+        lang[f'item.{namespace}.entry_{i}'] = value
+    return lang
+
+def synthetic_page(rng: random.Random, title, paragraphs):
+    lines = ['---', 'navigation:', f'  title: {title}', '  parent: index.md', '---', '', f'# {title}', '']
+    for i in range(paragraphs):
+        lines.append(' '.join(synthetic_text(rng) + '.' for _ in range(3)))
+        lines.append('')
+        if i % 3 == 0:
+            lines.append(f'<ItemImage id="{rng.choice(WORDS)}" />')
+            lines.append('')
+    # 以文本结尾的长标签块，回归检查 TAG_ONLY_PATTERN 不会在这类块上回溯卡住
+    lines.append('<Row>')
+    lines.extend(f'  <ItemImage id="{rng.choice(WORDS)}" />' for _ in range(24))
+    lines.append('</Row>')
+    lines.append(synthetic_text(rng) + '.')
+    lines.append('')
+    return '\n'.join(lines)
+
+def snbt_string(text):
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def synthetic_quest_lang(rng: random.Random, chapter, quests):
+    """:return: (SNBT 文本, 其中的字符串数)"""
+    lines = ['{', f'\tchapter.{chapter}.title: {snbt_string(synthetic_text(rng))}']
+    strings = 1
+    for i in range(quests):
+        quest_id = f'{chapter}{i:04X}'
+        lines.append(f'\tquest.{quest_id}.title: {snbt_string(synthetic_text(rng))}')
+        lines.append(f'\tquest.{quest_id}.quest_desc: [')
+        description = rng.randint(1, 4)
+        for _ in range(description):
+            lines.append(f'\t\t{snbt_string(synthetic_text(rng))}')
+        lines.append('\t]')
+        strings += 1 + description
+    lines.append('}')
+    return '\n'.join(lines) + '\n', strings
+
+def generate_modpack(pack_dir, jars=50, keys=200, zh_rate=0.5, lang_file_rate=0.2, guide_rate=0.1, pages=10, chapters=10, quests=20, duplicate_rate=0.1, seed=0):
+    """
+    生成合成的整合包：原版版本文件和资源索引、带 en_us/zh_cn 语言文件的模组 jar、
+    部分 jar 带旧版 .lang 文件和 AE2 手册，以及 FTB 任务语言文件
+    :param zh_rate: 自带中文翻译的 jar 比例，这些 jar 作为翻译参考
+    :return: 生成的数据规模
+    """
+    rng = random.Random(seed)
+    if os.path.isdir(pack_dir):
+        shutil.rmtree(pack_dir)
+
+    # 1. 原版
+    version_dir = os.path.join(pack_dir, 'minecraft', 'versions', '1.21.1')
+    assets_dir = os.path.join(pack_dir, 'minecraft', 'assets')
+    os.makedirs(version_dir)
+    vanilla_en = synthetic_lang(rng, 'minecraft', keys, duplicate_rate)
+    vanilla_zh = {key: '原版' + value for key, value in vanilla_en.items()}
+    with zipfile.ZipFile(os.path.join(version_dir, '1.21.1.jar'), 'w') as jar:
+        jar.writestr('assets/minecraft/lang/en_us.json', json.dumps(vanilla_en, indent=2))
+    zh_content = json.dumps(vanilla_zh, ensure_ascii=False, indent=2).encode('utf-8')
+    zh_hash = hashlib.sha1(zh_content).hexdigest()
+    os.makedirs(os.path.join(assets_dir, 'objects', zh_hash[:2]))
+    with open(os.path.join(assets_dir, 'objects', zh_hash[:2], zh_hash), 'wb') as f:
+        f.write(zh_content)
+    os.makedirs(os.path.join(assets_dir, 'indexes'))
+    with open(os.path.join(assets_dir, 'indexes', '17.json'), 'w', encoding='utf-8') as f:
+        json.dump({'objects': {'minecraft/lang/zh_cn.json': {'hash': zh_hash, 'size': len(zh_content)}}}, f)
+    with open(os.path.join(version_dir, '1.21.1.json'), 'w', encoding='utf-8') as f:
+        json.dump({'id': '1.21.1', 'assetIndex': {'id': '17'}}, f)
+
+    # 2. 模组
+    mods_dir = os.path.join(pack_dir, 'mods')
+    os.makedirs(mods_dir)
+    scale = {'jars': jars, 'lang_keys': 0, 'untranslated_keys': 0, 'guide_pages': 0, 'quest_chapters': chapters, 'quest_strings': 0}
+    for i in range(jars):
+        namespace = f'benchmod{i:03d}'
+        en = synthetic_lang(rng, namespace, keys, duplicate_rate)
+        scale['lang_keys'] += len(en)
+        with zipfile.ZipFile(os.path.join(mods_dir, f'{namespace}-1.0.0.jar'), 'w', zipfile.ZIP_DEFLATED) as jar:
+            jar.writestr('META-INF/MANIFEST.MF', 'Manifest-Version: 1.0\n')
+            jar.writestr(f'assets/{namespace}/textures/item/{namespace}.png', b'\x89PNG')
+            jar.writestr(f'assets/{namespace}/lang/en_us.json', json.dumps(en, indent=2))
+            if rng.random() < zh_rate:
+                jar.writestr(f'assets/{namespace}/lang/zh_cn.json', json.dumps({key: '参考' + value for key, value in en.items()}, ensure_ascii=False, indent=2))
+            else:
+                scale['untranslated_keys'] += len(en)
+            if rng.random() < lang_file_rate:
+                jar.writestr(f'assets/{namespace}/lang/en_us.lang', ''.join(f'{key}={value}\n' for key, value in en.items()))
+            if rng.random() < guide_rate:
+                for page in range(pages):
+                    jar.writestr(f'assets/{namespace}/ae2guide/page_{page}.md', synthetic_page(rng, f'{namespace} page {page}', 6))
+                    scale['guide_pages'] += 1
+
+    # 3. FTB 任务
+    quests_dir = os.path.join(pack_dir, 'ftbquests', 'quests', 'lang', 'en_us', 'chapters')
+    os.makedirs(quests_dir)
+    for chapter in range(chapters):
+        content, strings = synthetic_quest_lang(rng, f'{chapter:04X}', quests)
+        scale['quest_strings'] += strings
+        with open(os.path.join(quests_dir, f'chapter_{chapter}.snbt'), 'w', encoding='utf-8') as f:
+            f.write(content)
+    return scale
+
+def count_files(directory):
+    return sum(len(files) for _, _, files in os.walk(directory)) if os.path.isdir(directory) else 0
+
+def timed(name, func, server, items, report):
+    """执行一个阶段并记录耗时、吞吐量和接口请求数"""
+    before = server.stats()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    after = server.stats()
+    report[name] = {
+        'seconds': round(elapsed, 3),
+        'items': items,
+        'items_per_second': round(items / elapsed, 2) if elapsed > 0 and items else None,
+        'server': {key: after[key] - before[key] for key in after},
+    }
+    print(f'⏱ {name}: {elapsed:.2f} 秒, {items} 条')
+
+def run_stages(server, pack_dir, scale, engine, max_workers):
+    """依次计时各阶段，返回阶段名 -> 统计"""
+    # 各模块在导入时读取配置，必须在修改配置并切换到工作目录之后导入
+    from config import WORK_DIR, AE2_EN_OUT_DIR, AE2_ZH_OUT_DIR, TRANSLATION_STORE_FILE
+    from json_translate import prepare, do_translate
+    from markdown_translate import extract_ae2_markdown, translate_ae2_markdown
+    from ftbquest_translate import translate_quests
+    from translation_store import TranslationStore
+
+    stages = {}
+    timed('prepare_cold', prepare, server, scale['lang_keys'], stages)
+    timed('prepare_warm', prepare, server, scale['lang_keys'], stages)
+    untranslated = TranslationStore(TRANSLATION_STORE_FILE).stats('pack')['status'].get('untranslated', 0)
+    timed('translate_json', lambda: do_translate(max_workers, engine), server, untranslated, stages)
+    timed('extract_ae2_markdown', lambda: extract_ae2_markdown(config.MODS_DIR, AE2_EN_OUT_DIR), server, scale['guide_pages'], stages)
+    timed('translate_ae2_markdown', lambda: translate_ae2_markdown(AE2_EN_OUT_DIR, AE2_ZH_OUT_DIR, max_workers=max_workers, engine=engine),
+          server, count_files(AE2_EN_OUT_DIR), stages)
+    timed('translate_quests', lambda: translate_quests(
+        os.path.join(pack_dir, 'ftbquests', 'quests', 'lang', 'en_us'), WORK_DIR + '/ftbquests/quests/lang/zh_cn',
+        max_workers=max_workers, engine=engine,
+    ), server, scale['quest_strings'], stages)
+    return stages
+
+def run_benchmark(workspace='bench', report_file=None, engine='thread', max_workers=8, latency=0.05, tokens_per_second=0, error_rate=0.0, backend='chroma', **pack_options):
+    """
+    在 workspace 中生成合成整合包，启动本地接口，依次计时 prepare()（首次和无变化的第二次）、
+    translate_json、translate_ae2_markdown 和 translate_quests，结果写入 JSON 报告
+    """
+    workspace = os.path.abspath(workspace)
+    if os.path.isdir(workspace):
+        shutil.rmtree(workspace)
+    pack_dir = os.path.join(workspace, 'pack')
+    scale = generate_modpack(pack_dir, **pack_options)
+    report_file = os.path.abspath(report_file or os.path.join(workspace, f'report-{time.strftime("%Y%m%d-%H%M%S")}.json'))
+
+    with FakeOpenAIServer(latency=latency, tokens_per_second=tokens_per_second, error_rate=error_rate, embed_dimensions=config.openai_embed_dimensions) as server:
+        # 模组目录、版本文件和接口地址指向合成整合包和本地接口
+        config.MODS_DIR = os.path.join(pack_dir, 'mods')
+        config.VERSION_JSON = os.path.join(pack_dir, 'minecraft', 'versions', '1.21.1', '1.21.1.json')
+        config.openai_llm_base_url = server.base_url
+        config.openai_embed_base_url = server.base_url
+        config.openai_api_key = 'benchmark'
+        config.VECTOR_BACKEND = backend
+        config.TRANSLATE_ENGINE = engine
+        cwd = os.getcwd()
+        os.chdir(workspace)
+        try:
+            stages = run_stages(server, pack_dir, scale, engine, max_workers)
+        finally:
+            os.chdir(cwd)
+        server_stats = server.stats()
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': git_revision(REPO_DIR),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'parameters': {'engine': engine, 'max_workers': max_workers, 'latency': latency, 'tokens_per_second': tokens_per_second,
+                       'error_rate': error_rate, 'backend': backend, **pack_options},
+        'scale': scale,
+        'stages': stages,
+        'total_seconds': round(sum(stage['seconds'] for stage in stages.values()), 3),
+        'server': server_stats,
+    }
+    os.makedirs(os.path.dirname(report_file), exist_ok=True)
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'📊 基准测试报告已保存至: {report_file}')
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='使用本地模拟接口和合成整合包测量翻译流程的吞吐量')
+    parser.add_argument('--workspace', default='bench', help='工作目录，每次运行前会被清空')
+    parser.add_argument('--report', help='报告文件路径，默认写入工作目录')
+    parser.add_argument('--engine', default='thread', choices=['thread', 'async'])
+    parser.add_argument('--max-workers', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05, help='每个请求的首 token 延迟（秒）')
+    parser.add_argument('--tokens-per-second', type=float, default=0, help='流式输出速度，0 表示不限速')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='随机返回 429 的概率')
+    parser.add_argument('--backend', default='chroma', choices=['chroma', 'mmap'])
+    parser.add_argument('--jars', type=int, default=50)
+    parser.add_argument('--keys', type=int, default=200, help='每个 jar 的语言条目数')
+    parser.add_argument('--zh-rate', type=float, default=0.5, help='自带中文翻译的 jar 比例')
+    parser.add_argument('--guide-rate', type=float, default=0.1, help='带 AE2 手册的 jar 比例')
+    parser.add_argument('--pages', type=int, default=10, help='每本手册的页数')
+    parser.add_argument('--chapters', type=int, default=10)
+    parser.add_argument('--quests', type=int, default=20, help='每个章节的任务数')
+    parser.add_argument('--duplicate-rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run_benchmark(
+        args.workspace, args.report, args.engine, args.max_workers, args.latency, args.tokens_per_second, args.error_rate, args.backend,
+        jars=args.jars, keys=args.keys, zh_rate=args.zh_rate, guide_rate=args.guide_rate, pages=args.pages,
+        chapters=args.chapters, quests=args.quests, duplicate_rate=args.duplicate_rate, seed=args.seed,
+    )
@@ -0,0 +1,77 @@
+import math
+
+import numpy as np
+
+from token_budget import estimate_entry_tokens
+
+# 原版语言键的类型前缀，第二段为命名空间，如 item.mekanism.steel_casing
+TYPE_PREFIXES = {
+    'item', 'block', 'fluid', 'entity', 'effect', 'enchantment', 'biome', 'itemGroup', 'container', 'gui', 'tooltip',
+    'advancements', 'subtitles', 'death', 'key', 'stat', 'attribute', 'painting', 'jei', 'emi', 'config', 'commands',
+}
+
+
+def key_group(key: str, namespaces: dict | None = None):
+    """
+    返回键的 (命名空间, 类型前缀)：
+    item.mekanism.steel_casing -> (mekanism, item)，mekanism.gui.energy -> (mekanism, '')
+    :param namespaces: 已知的 key -> 命名空间，优先使用
+    """
+    parts = key.split('.')
+    prefix = parts[0] if len(parts) >= 3 and parts[0] in TYPE_PREFIXES else ''
+    if namespaces and key in namespaces:
+        return namespaces[key], prefix
+    if prefix:
+        return parts[1], prefix
+    return parts[0], ''
+
+def kmeans_order(keys, vectors: np.ndarray, cluster_size, iterations=8, seed=0):
+    """
+    球面 k-means，按簇输出键的顺序，语义相近的条目排在一起
+    :param vectors: 归一化的向量，与 keys 一一对应
+    """
+    k = max(1, math.ceil(len(keys) / cluster_size))
+    if k == 1:
+        return list(keys)
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(keys), k, replace=False)]
+    for _ in range(iterations):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(k):
+            members = vectors[labels == cluster]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[cluster] = centroid / (np.linalg.norm(centroid) or 1.0)
+    labels = np.argmax(vectors @ centroids.T, axis=1)
+    return [key for _, key in sorted(zip(labels.tolist(), keys), key=lambda item: item[0])]
+
+def compose_entries(d: dict, grouping='namespace', namespaces=None, embeddings=None, token_budget=6500):
+    """
+    调整待翻译条目的顺序，使同一个分块中的条目共享术语：
+    namespace 按命名空间和类型前缀排序；embedding 在此基础上对较大的命名空间按嵌入向量聚类；none 保持原顺序
+    :param embeddings: 带 embed_documents 的嵌入模型，embedding 模式使用
+    :param token_budget: 每个分块可用的 token 数，用于估算每个簇的大小
+    :return: 重新排序的字典
+    """
+    if grouping == 'none' or len(d) < 2:
+        return d
+
+    groups = {}
+    for key in d:
+        namespace, prefix = key_group(key, namespaces)
+        groups.setdefault(namespace, {}).setdefault(prefix, []).append(key)
+
+    ordered = []
+    for namespace in sorted(groups):
+        # 同一命名空间内按类型前缀分组，前缀内保持原顺序（通常相邻的键属于同一类物品）
+        keys = [key for prefix in sorted(groups[namespace]) for key in groups[namespace][prefix]]
+        if grouping == 'embedding' and embeddings is not None:
+            average_tokens = sum(sum(estimate_entry_tokens(key, d[key])) for key in keys) / len(keys)
+            cluster_size = max(2, int(token_budget / max(average_tokens, 1)))
+            if len(keys) > cluster_size * 2:
+                texts = [d[key] if isinstance(d[key], str) else '\n'.join(map(str, d[key])) for key in keys]
+                vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                keys = kmeans_order(keys, vectors, cluster_size)
+        ordered.extend(keys)
+    return {key: d[key] for key in ordered}
@@ -5,17 +5,111 @@ VERSION_JSON = '/home/yourname/.minecraft/versions/1.21.1/1.21.1.json'
 WORK_DIR = 'work'
 EN_OUT_DIR = WORK_DIR + '/en'
 ZH_OUT_DIR = WORK_DIR + '/zh'
-MERGED_EN_FILE = WORK_DIR + '/merged/merged_output_en.json'
-MERGED_ZH_FILE = WORK_DIR + '/merged/merged_output_zh.json'
-MERGED_MAP_FILE = WORK_DIR + '/merged/merged_en2zh.json'
+# 参考翻译（原版、模组、CFPA 和额外已翻译文本）的提取目录
+REF_EN_OUT_DIR = WORK_DIR + '/reference/en'
+REF_ZH_OUT_DIR = WORK_DIR + '/reference/zh'
+# 参考翻译的 原文 -> 译文 映射，由翻译存储导出，用于术语表和向量索引
+REF_MERGED_MAP_FILE = WORK_DIR + '/reference/merged_en2zh.json'
+# 所有语言条目（原文、译文、来源和状态）的 SQLite 存储
+TRANSLATION_STORE_FILE = WORK_DIR + '/translation_store.sqlite'
+# 翻译结果导出的资源包
+RESOURCE_PACK_FILE = WORK_DIR + '/translated_resource_pack.zip'
+# 增量模式：上一个版本提取的英文目录（或合并的 json）和发布的译文（translated.json、资源包 zip 或导出目录），
+# 都配置时原文没有变化的键沿用上个版本的译文，只翻译新增和变化的键，为空时不启用
+PREVIOUS_EN_PATH = ''
+PREVIOUS_TRANSLATED_PATH = ''
+# prepare() 各阶段的指纹记录
+PIPELINE_STATE_FILE = WORK_DIR + '/cache/pipeline_state.json'
 AE2_EN_OUT_DIR = WORK_DIR + '/ae2/en'
 AE2_ZH_OUT_DIR = WORK_DIR + '/ae2/zh'
+# AE2 手册的片段译文缓存和原文哈希记录
+AE2_SEGMENT_CACHE_FILE = WORK_DIR + '/cache/ae2_segments.sqlite'
+AE2_MANIFEST_FILE = WORK_DIR + '/ae2/manifest.json'
 CFPA_PATH = WORK_DIR + '/Minecraft-Mod-Language-Package'
 CFPA_PROJECT_VERSION = '1.21'
+# jar 扫描索引，未变化的 jar 不会被重新打开
+JAR_INDEX_FILE = WORK_DIR + '/cache/jar_index.json'
+# 翻译日志目录，用于中断后继续翻译
+JOURNAL_DIR = WORK_DIR + '/journal'
+# 嵌入向量磁盘缓存
+EMBED_CACHE_FILE = WORK_DIR + '/cache/embed_cache.sqlite'
+EMBED_CACHE_MAX_ENTRIES = 1_000_000
+# 参考索引后端: chroma 或 mmap (导出为内存映射矩阵，使用 NumPy 批量检索)
+VECTOR_BACKEND = 'chroma'
+# mmap 后端的向量存储精度: float16 或 int8
+VECTOR_MMAP_DTYPE = 'float16'
+# 检索结果内存缓存的最大条目数
+SEARCH_CACHE_MAX_ENTRIES = 50_000
+# 各阶段耗时的 JSONL 追踪文件和 Prometheus 文本格式的汇总文件，为空时不输出
+METRICS_TRACE_FILE = WORK_DIR + '/metrics/trace.jsonl'
+METRICS_SUMMARY_FILE = WORK_DIR + '/metrics/translate.prom'
+# 汇总文件的刷新间隔（秒）
+METRICS_EXPORT_INTERVAL = 10
+# 追踪文件超过该大小时轮换为 trace.jsonl.1，只保留一份旧文件
+METRICS_TRACE_MAX_BYTES = 64 * 1024 * 1024
+# 是否在终端输出每个分块的译文和参考上下文
+VERBOSE_OUTPUT = False
 
 # AI 大模型配置
 openai_embed_base_url = ""
 openai_llm_base_url = ""
 openai_embed_model = "gte-multilingual-base"
+openai_embed_dimensions = 768
 openai_llm_model = "gpt4o"
-openai_api_key = ""
\ No newline at end of file
+openai_api_key = ""
+
+# 翻译引擎: thread 使用固定线程池, async 使用自适应并发的异步引擎
+TRANSLATE_ENGINE = "thread"
+ASYNC_INITIAL_CONCURRENCY = 8
+ASYNC_MAX_CONCURRENCY = 64
+# 术语表未覆盖到专有名词时，是否调用大模型提取关键词作为兜底
+GLOSSARY_LLM_FALLBACK = False
+# 每个翻译请求中参考上下文的 token 预算，按相关度挑选参考直到用完
+CONTEXT_TOKEN_BUDGET = 1500
+# 每个翻译请求的 token 预算（输入加输出，含参考上下文）和输出 token 上限
+CHUNK_TOKEN_BUDGET = 8000
+CHUNK_MAX_OUTPUT_TOKENS = 4000
+# 调度优先级：按翻译键匹配 (fnmatch) 的优先级，数字越小越先翻译，第一个匹配的规则生效，都不匹配时为 SCHEDULE_DEFAULT_PRIORITY
+# 同一优先级内按预估耗时从长到短调度
+SCHEDULE_PRIORITY_PATTERNS = [
+    # 长文本放在名称规则之前，item.create.brass_hand.tooltip.summary、block.mekanism.energy_cube.desc 属于长文本
+    ('advancements.*', 2), ('tooltip.*', 2), ('*.tooltip*', 2), ('*.desc*', 2), ('*_desc*', 2),
+    ('item.*', 0), ('block.*', 0), ('fluid.*', 0), ('entity.*', 0), ('itemGroup.*', 0),
+    # FTB 任务 (ftb quest lang splitter) 的键，如 quest.<ID>.title、quest.<ID>.quest_desc[0]，重复原文的代表键可能带 # 后缀
+    ('chapter.*.title*', 0), ('quest.*.title*', 0), ('chapter_group.*.title*', 0), ('task.*.title*', 0),
+    ('reward.*.title*', 0), ('reward_table.*.title*', 0), ('file.*.title*', 0),
+    ('quest.*.quest_subtitle*', 1), ('chapter.*.chapter_subtitle*', 1),
+]
+SCHEDULE_DEFAULT_PRIORITY = 1
+# 预估耗时时输出 token 相对输入 token 的权重
+SCHEDULE_OUTPUT_WEIGHT = 4
+# 分块的组成方式: none 保持原顺序, namespace 按命名空间和键前缀分组, embedding 再对较大的命名空间按嵌入向量聚类
+CHUNK_GROUPING = 'namespace'
+# 模板化翻译：只有一个词不同的条目族（如 Oak Planks / Spruce Planks）只翻译一次模板，填充词单独翻译后在本地组合，
+# 组合出的译文在翻译存储中标记来源为 template，至少包含 TEMPLATE_MIN_FAMILY 种填充词的族才使用模板
+TEMPLATE_FACTORING = True
+TEMPLATE_MIN_FAMILY = 3
+TEMPLATE_SLOT_FILLERS = [
+    # 木材
+    'Oak', 'Spruce', 'Birch', 'Jungle', 'Acacia', 'Dark Oak', 'Mangrove', 'Cherry', 'Bamboo', 'Crimson', 'Warped',
+    # 颜色
+    'White', 'Orange', 'Magenta', 'Light Blue', 'Yellow', 'Lime', 'Pink', 'Gray', 'Light Gray', 'Cyan', 'Purple',
+    'Blue', 'Brown', 'Green', 'Red', 'Black',
+    # 金属和材料
+    'Iron', 'Gold', 'Copper', 'Tin', 'Lead', 'Silver', 'Nickel', 'Aluminum', 'Zinc', 'Bronze', 'Brass', 'Steel',
+    'Invar', 'Electrum', 'Constantan', 'Osmium', 'Uranium', 'Platinum', 'Netherite', 'Diamond', 'Emerald',
+    # 等级
+    'Basic', 'Advanced', 'Elite', 'Ultimate', 'Creative', 'Improved', 'Reinforced', 'Hardened', 'Resonant',
+]
+# 逐键校验失败（缺失、占位符不一致、未翻译）的条目最多翻译的次数，失败的键单独组成小批次重试
+VALIDATION_MAX_ATTEMPTS = 3
+# 每个接口地址的 HTTP 连接池大小，为 0 时取 max(ASYNC_MAX_CONCURRENCY, 16)
+HTTP_POOL_SIZE = 0
+# 接口配额，0 表示不限制
+LLM_REQUESTS_PER_MINUTE = 0
+LLM_TOKENS_PER_MINUTE = 0
+# 常驻翻译服务 (translate_server.py) 的监听地址，以及合并并发小请求的时间窗口（秒）
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8848
+SERVER_BATCH_WINDOW = 0.05
+SERVER_MAX_WORKERS = 8
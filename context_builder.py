@@ -0,0 +1,67 @@
+from config import VERBOSE_OUTPUT
+from glossary import tokenize
+from metrics import metrics
+from token_budget import estimate_tokens
+
+
+def reference_words(reference: str):
+    """参考条目 key=value 中英文部分的归一化单词集合"""
+    return {word for word, _, _ in tokenize(reference.split('=', 1)[0])}
+
+def jaccard(a: set, b: set):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def build_context(candidates: dict, source_texts, token_budget=1500, overlap_weight=0.5, mmr_lambda=0.7, duplicate_threshold=0.9):
+    """
+    从检索到的参考中挑选最有用的部分放入提示词：
+    按相似度和与原文的词汇重合度打分，使用 MMR 去除近似重复的参考，直到达到 token 预算
+    :param candidates: 参考文本 key=value -> 相似度 (0~1)，术语表精确匹配的参考相似度为 1
+    :param source_texts: 待翻译的原文列表
+    :param token_budget: 参考上下文的 token 上限
+    :return: 按得分排序的参考列表
+    """
+    source_words = set()
+    for text in source_texts:
+        source_words.update(word for word, _, _ in tokenize(text))
+
+    scored = []
+    for reference, similarity in candidates.items():
+        words = reference_words(reference)
+        overlap = len(words & source_words) / len(words) if words else 0.0
+        scored.append((similarity + overlap_weight * overlap, reference, words))
+    scored.sort(key=lambda item: item[0], reverse=True)
+
+    selected = []
+    used_tokens = 0
+    remaining = scored
+    # 每个候选与已选参考的最大相似度，每选中一条后增量更新
+    redundancy = [0.0] * len(remaining)
+    while remaining and used_tokens < token_budget:
+        best_index = None
+        best_value = None
+        for index, (score, reference, words) in enumerate(remaining):
+            if redundancy[index] >= duplicate_threshold:
+                continue
+            value = mmr_lambda * score - (1 - mmr_lambda) * redundancy[index]
+            if best_value is None or value > best_value:
+                best_index, best_value = index, value
+        if best_index is None:
+            break
+        score, reference, chosen_words = remaining.pop(best_index)
+        redundancy.pop(best_index)
+        tokens = estimate_tokens(reference) + 1
+        if used_tokens + tokens > token_budget:
+            continue
+        selected.append(reference)
+        used_tokens += tokens
+        for index, (_, _, words) in enumerate(remaining):
+            redundancy[index] = max(redundancy[index], jaccard(words, chosen_words))
+
+    metrics.inc("retrieval_candidates", len(candidates))
+    metrics.inc("context_references", len(selected))
+    metrics.inc("context_tokens", used_tokens)
+    if VERBOSE_OUTPUT:
+        print(f"参考上下文: 候选 {len(candidates)} 条, 选用 {len(selected)} 条, 约 {used_tokens} tokens")
+    return selected
@@ -0,0 +1,82 @@
+import fnmatch
+import json
+import os
+import zipfile
+
+from journal import write_text_atomic
+from translation_store import iter_lang_files
+
+
+def load_previous_sources(path):
+    """
+    读取上一个版本的英文原文：提取目录 (<命名空间>.json) 或合并后的单个 json 文件
+    :return: key -> 英文
+    """
+    if os.path.isdir(path):
+        sources = {}
+        for namespace, data in iter_lang_files(path):
+            sources.update(data)
+        return sources
+    with open(path, 'r', encoding='utf-8') as f:
+        return {key: value for key, value in json.load(f).items() if isinstance(value, str)}
+
+def load_previous_translations(path, lang='zh_cn'):
+    """
+    读取上一个版本发布的译文，支持三种格式：
+    translated.json (key -> 中文)、资源包 zip、按命名空间导出的目录 (<命名空间>/lang/zh_cn.json)
+    :return: key -> 中文
+    """
+    translations = {}
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            for file in files:
+                if file == f'{lang}.json' and os.path.basename(root) == 'lang':
+                    with open(os.path.join(root, file), 'r', encoding='utf-8') as f:
+                        translations.update(json.load(f))
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path, 'r') as pack:
+            for name in pack.namelist():
+                if fnmatch.fnmatch(name, f'assets/*/lang/{lang}.json'):
+                    with pack.open(name) as f:
+                        translations.update(json.loads(f.read().decode('utf-8')))
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            translations = json.load(f)
+    return {key: value for key, value in translations.items() if isinstance(value, str)}
+
+def classify_keys(previous_sources: dict, current_sources: dict):
+    """
+    对比两个版本的英文原文
+    :return: {'unchanged': [...], 'changed': [...], 'new': [...], 'removed': [...]}
+    """
+    delta = {'unchanged': [], 'changed': [], 'new': [], 'removed': []}
+    for key, value in current_sources.items():
+        previous = previous_sources.get(key)
+        if previous is None:
+            delta['new'].append(key)
+        elif previous == value:
+            delta['unchanged'].append(key)
+        else:
+            delta['changed'].append(key)
+    delta['removed'] = [key for key in previous_sources if key not in current_sources]
+    return delta
+
+def carry_forward_release(store, previous_sources_path, previous_translations_path, scope='pack', report_file=None):
+    """
+    增量模式：与上一个版本的英文原文对比，原文没有变化的键沿用上一个版本发布的译文，
+    只有新增和原文变化的键留给大模型翻译
+    :return: 分类结果
+    """
+    previous_sources = load_previous_sources(previous_sources_path)
+    previous_translations = load_previous_translations(previous_translations_path)
+    delta = classify_keys(previous_sources, store.sources(scope))
+
+    carried = {key: previous_translations[key] for key in delta['unchanged'] if key in previous_translations}
+    filled = store.fill_targets(scope, carried, 'previous')
+    counts = {name: len(keys) for name, keys in delta.items()}
+    print(f"增量对比: {counts}, 沿用上个版本的译文: {filled}")
+
+    if report_file:
+        report = {'counts': counts, 'carried': filled, 'changed': delta['changed'], 'new': delta['new'], 'removed': delta['removed']}
+        write_text_atomic(report_file, json.dumps(report, ensure_ascii=False, indent=2))
+    return delta
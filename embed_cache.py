@@ -0,0 +1,140 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带磁盘缓存的嵌入模型包装，按 (模型, 维度, 文本) 缓存向量，
+    超出 max_entries 时淘汰最久未使用的条目。命中时只在内存中记录使用时间，
+    随下一次写入新向量时一起更新，只读的检索不产生数据库写入
+    """
+
+    def __init__(self, inner: Embeddings, model: str, dimensions: int, cache_file: str, max_entries=1_000_000):
+        self.inner = inner
+        self.model = model
+        self.dimensions = dimensions
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> 最近命中的时间，尚未写入数据库
+        self._touched = {}
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(cache_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings (used)")
+        self._conn.commit()
+
+    def _key(self, text: str):
+        return hashlib.sha256(f"{self.model}\0{self.dimensions}\0{text}".encode("utf-8")).hexdigest()
+
+    def _load(self, keys):
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            now = time.time()
+            self._touched.update(dict.fromkeys(found, now))
+        return found
+
+    def _store(self, items):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("UPDATE embeddings SET used = ? WHERE key = ?", [(used, key) for key, used in self._touched.items()])
+            self._touched.clear()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items],
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._key(text) for text in texts]
+        cached = self._load(list(dict.fromkeys(keys)))
+        missing = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in cached))
+        missing_count = sum(1 for key in keys if key not in cached)
+        with self._lock:
+            self.hits += len(texts) - missing_count
+            self.misses += missing_count
+        if missing:
+            vectors = self.inner.embed_documents(missing)
+            new_items = [(self._key(text), vector) for text, vector in zip(missing, vectors)]
+            self._store(new_items)
+            cached.update(new_items)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class SearchCache:
+    """
+    similarity_search 结果的内存 LRU 缓存，
+    索引版本（嵌入模型和内容哈希）变化或显式失效时清空
+    """
+
+    def __init__(self, max_entries=50_000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def check_version(self, collection_id, version):
+        """集合版本变化时丢弃该集合的缓存"""
+        with self._lock:
+            if self._versions.get(collection_id) != version:
+                self._versions[collection_id] = version
+                for key in [key for key in self._entries if key[0] == collection_id]:
+                    del self._entries[key]
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
@@ -0,0 +1,227 @@
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from token_budget import estimate_tokens
+
+JSON_BLOCK_PATTERN = re.compile(r'```json\n(.*?)\n```', re.DOTALL)
+MARKDOWN_BLOCK_PATTERN = re.compile(r'```markdown\n(.*?)\n```', re.DOTALL)
+UNTRANSLATED_PATTERN = re.compile(r'待翻译内容:\n(.*?)\n</untranslated>', re.DOTALL)
+INPUT_DOCUMENT_PATTERN = re.compile(r'<input_document>\n(.*?)\n</input_document>', re.DOTALL)
+WORD_PATTERN = re.compile(r'[A-Z][a-z]{3,}')
+
+
+def fake_translate_text(text: str):
+    """在原文前加上中文前缀，占位符和格式代码保持不变，可以通过译文校验"""
+    return '译' + text if text.strip() else text
+
+def fake_translate_value(value):
+    if isinstance(value, str):
+        return fake_translate_text(value)
+    if isinstance(value, list):
+        return [fake_translate_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: fake_translate_value(item) for key, item in value.items()}
+    return value
+
+def fake_answer(prompt: str):
+    """
+    根据项目中各个提示词的结构生成回答：
+    语言文件翻译返回 JSON，手册翻译返回 markdown，关键词提取返回一行一个单词
+    """
+    for pattern in (UNTRANSLATED_PATTERN, JSON_BLOCK_PATTERN):
+        match = pattern.search(prompt)
+        if match:
+            try:
+                return json.dumps(fake_translate_value(json.loads(match.group(1))), ensure_ascii=False)
+            except json.JSONDecodeError:
+                break
+    match = MARKDOWN_BLOCK_PATTERN.search(prompt)
+    if match:
+        return fake_translate_text(match.group(1))
+    match = INPUT_DOCUMENT_PATTERN.search(prompt)
+    if match:
+        return '\n'.join(dict.fromkeys(WORD_PATTERN.findall(match.group(1))))
+    return '译文'
+
+def fake_embedding(text: str, dimensions: int):
+    """由文本哈希生成确定的单位向量，相同文本的向量相同"""
+    seed = int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:8], 'little')
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class FakeOpenAIServer:
+    """
+    本地的 OpenAI 兼容接口，支持 /v1/chat/completions (含流式输出) 和 /v1/embeddings，
+    用于在没有付费接口的情况下测量整个流程的吞吐量
+    :param latency: 每个请求返回首个 token 前的延迟（秒）
+    :param tokens_per_second: 流式输出的速度，0 表示不限速
+    :param error_rate: 随机返回 429 的概率
+    :param embed_dimensions: 请求中没有指定 dimensions 时的向量维度
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, tokens_per_second=0, error_rate=0.0, embed_dimensions=768, seed=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.embed_dimensions = embed_dimensions
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {'chat_requests': 0, 'embed_requests': 0, 'embed_inputs': 0, 'rate_limited': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, **values):
+        with self._lock:
+            for name, value in values.items():
+                self._stats[name] += value
+
+    def _should_reject(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-openai', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # 保持连接，和真实接口一样复用连接池
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, payload, headers=None):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_chunk(self, data: bytes):
+                self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+                self.wfile.flush()
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                request = json.loads(self.rfile.read(length) or b'{}')
+                if server._should_reject():
+                    server._count(rate_limited=1)
+                    self.send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'rate_limit_exceeded', 'code': 'rate_limit_exceeded'}}, {'Retry-After': '1'})
+                    return
+                if self.path.endswith('/chat/completions'):
+                    self.chat(request)
+                elif self.path.endswith('/embeddings'):
+                    self.embeddings(request)
+                else:
+                    self.send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+
+            def chat(self, request):
+                prompt = '\n'.join(str(message.get('content', '')) for message in request.get('messages', []))
+                answer = fake_answer(prompt)
+                prompt_tokens = estimate_tokens(prompt)
+                completion_tokens = estimate_tokens(answer)
+                server._count(chat_requests=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+                usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': prompt_tokens + completion_tokens}
+                created = int(time.time())
+                model = request.get('model', 'fake')
+                time.sleep(server.latency)
+
+                if not request.get('stream'):
+                    if server.tokens_per_second:
+                        time.sleep(completion_tokens / server.tokens_per_second)
+                    self.send_json(200, {
+                        'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': created, 'model': model,
+                        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': answer}, 'finish_reason': 'stop'}],
+                        'usage': usage,
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+
+                def event(delta, finish_reason=None):
+                    payload = {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                               'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+                    self.send_chunk(f'data: {json.dumps(payload, ensure_ascii=False)}\n\n'.encode('utf-8'))
+
+                # 每个事件约 16 个字符，按 tokens_per_second 控制输出速度
+                event({'role': 'assistant', 'content': ''})
+                for start in range(0, len(answer), 16):
+                    piece = answer[start:start + 16]
+                    if server.tokens_per_second:
+                        time.sleep(estimate_tokens(piece) / server.tokens_per_second)
+                    event({'content': piece})
+                event({}, 'stop')
+                self.send_chunk(b'data: [DONE]\n\n')
+                self.send_chunk(b'')
+
+            def embeddings(self, request):
+                inputs = request.get('input', [])
+                if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                    inputs = [inputs]
+                dimensions = request.get('dimensions') or server.embed_dimensions
+                data = []
+                for index, text in enumerate(inputs):
+                    vector = fake_embedding(text if isinstance(text, str) else json.dumps(text), dimensions)
+                    if request.get('encoding_format') == 'base64':
+                        vector = base64.b64encode(struct.pack(f'<{dimensions}f', *vector)).decode('ascii')
+                    data.append({'object': 'embedding', 'index': index, 'embedding': vector})
+                tokens = sum(estimate_tokens(text) if isinstance(text, str) else len(text) for text in inputs)
+                server._count(embed_requests=1, embed_inputs=len(inputs), prompt_tokens=tokens)
+                time.sleep(server.latency)
+                self.send_json(200, {'object': 'list', 'data': data, 'model': request.get('model', 'fake'),
+                                     'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}})
+
+        return Handler
+
+
+if __name__ == '__main__':
+    with FakeOpenAIServer(port=8765, latency=0.2, tokens_per_second=200) as fake_server:
+        print(f'本地接口已启动: {fake_server.base_url}')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
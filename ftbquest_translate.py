@@ -2,8 +2,12 @@ import os
 
 import ftb_snbt_lib as slib
 
-from ai_translate import translate_dict
-from config import WORK_DIR
+from ai_translate import build_dict_translator, dispatch_translate_chunks, report_validation_failures
+from config import WORK_DIR, JOURNAL_DIR, CHUNK_TOKEN_BUDGET, CHUNK_MAX_OUTPUT_TOKENS, CONTEXT_TOKEN_BUDGET, VALIDATION_MAX_ATTEMPTS
+from scheduler import pack_scheduled_chunks
+from journal import TranslationJournal
+from metrics import metrics
+from validation import make_validated
 
 
 def dict_to_slib(data: dict) -> slib.Compound:
@@ -18,27 +22,112 @@ def dict_to_slib(data: dict) -> slib.Compound:
             result[key] = slib.String(value)
     return result
 
-def translate_snbt_lang(input_snbt, output_snbt):
-    with open(input_snbt, 'r', encoding='utf-8') as f:
-        tag = slib.load(f)
-    output = translate_dict(tag)
-    with open(output_snbt, 'w', encoding='utf-8') as f:
-        slib.dump(dict_to_slib(output), f)
-
-def translate_quests(dir_path='quests/lang/en_us', out_path='quests/lang/zh_cn'):
-    # translate_snbt_lang(vectorstore, 'ftbquests/lang/en_us.snbt', 'ftbquests/lang/zh_cn.snbt')
-    for root, paths, files in os.walk(dir_path):
-        for file in files:
+def write_quest_lang(data: dict, output_snbt):
+    out_dirname = os.path.dirname(output_snbt)
+    if out_dirname:
+        os.makedirs(out_dirname, exist_ok=True)
+    tmp_snbt = output_snbt + '.tmp'
+    with open(tmp_snbt, 'w', encoding='utf-8') as f:
+        slib.dump(dict_to_slib(data), f)
+    os.replace(tmp_snbt, output_snbt)
+
+def flatten_quest_lang(tag: dict):
+    """
+    展开任务语言文件，返回 [(键, 列表下标或 None, 文本)]，列表形式的描述按行展开
+    """
+    entries = []
+    for key, value in tag.items():
+        if isinstance(value, str):
+            entries.append((key, None, str(value)))
+        elif isinstance(value, list):
+            for index, item in enumerate(value):
+                entries.append((key, index, str(item)))
+    return entries
+
+def translate_quests(dir_path='quests/lang/en_us', out_path='quests/lang/zh_cn', max_workers=8, engine=None):
+    """
+    一次性读取所有任务语言文件，展开并按原文去重后放入同一个工作队列翻译，
+    所有文件共享同一套客户端，每个文件的条目全部完成后立即写出
+    """
+    # 校验失败的原文不会写入，所在文件保持未完成，重新运行时只翻译这些原文
+    failures = {}
+    translate, atranslate = make_validated(*build_dict_translator(), failures, VALIDATION_MAX_ATTEMPTS)
+
+    # 1. 读取所有未翻译的文件，展开条目
+    files = {}
+    # 原文 -> 所有使用该原文的 (文件, 键, 列表下标)
+    targets = {}
+    for root, paths, file_names in os.walk(dir_path):
+        for file in file_names:
             full_path = os.path.join(root, file)
             rel_path = os.path.relpath(full_path, dir_path).replace(os.sep, '/')
-            if rel_path.endswith('.snbt'):
-                out_full_path = os.path.join(out_path, rel_path)
-                if os.path.exists(out_full_path):
+            if not rel_path.endswith('.snbt'):
+                continue
+            out_full_path = os.path.join(out_path, rel_path)
+            if os.path.exists(out_full_path):
+                continue
+            with open(full_path, 'r', encoding='utf-8') as f:
+                tag = slib.load(f)
+            output = {key: list(map(str, value)) if isinstance(value, list) else str(value) for key, value in tag.items()}
+            files[rel_path] = {'output': output, 'out_file': out_full_path, 'remaining': 0}
+            for key, index, text in flatten_quest_lang(tag):
+                if not text.strip():
                     continue
-                out_dirname = os.path.dirname(out_full_path)
-                if not os.path.exists(out_dirname):
-                    os.makedirs(out_dirname)
-                translate_snbt_lang(full_path, out_full_path)
+                files[rel_path]['remaining'] += 1
+                targets.setdefault(text, []).append((rel_path, key, index))
+
+    def fill(text, translated):
+        for rel_path, key, index in targets.pop(text, []):
+            quest_file = files[rel_path]
+            if index is None:
+                quest_file['output'][key] = translated
+            else:
+                quest_file['output'][key][index] = translated
+            quest_file['remaining'] -= 1
+            if quest_file['remaining'] == 0:
+                write_quest_lang(quest_file['output'], quest_file['out_file'])
+                print(f"处理完成: {rel_path}")
+
+    # 2. 从日志恢复已经翻译过的原文，没有需要翻译条目的文件直接写出
+    journal = TranslationJournal(os.path.join(JOURNAL_DIR, 'ftbquests.jsonl'))
+    for text, translated in journal.load().items():
+        if text in targets:
+            fill(text, translated)
+    for rel_path, quest_file in files.items():
+        if quest_file['remaining'] == 0 and not os.path.exists(quest_file['out_file']):
+            write_quest_lang(quest_file['output'], quest_file['out_file'])
+
+    # 3. 每个原文使用第一次出现的键作为代表键，保留键名中的上下文
+    unique = {}
+    for text, text_targets in targets.items():
+        rel_path, key, index = text_targets[0]
+        rep_key = key if index is None else f'{key}[{index}]'
+        while rep_key in unique:
+            rep_key += '#'
+        unique[rep_key] = text
+    print(f'任务文件: {len(files)}, 待翻译原文: {len(unique)}')
+
+    def on_result(result):
+        done = {}
+        for rep_key, translated in result.items():
+            text = unique.get(rep_key)
+            if text is None or not isinstance(translated, str):
+                continue
+            done[text] = translated
+            fill(text, translated)
+        journal.append(done)
+        print(f'剩余原文: {len(targets)}')
+
+    with journal:
+        failed = dispatch_translate_chunks(translate, atranslate, pack_scheduled_chunks(unique, CHUNK_TOKEN_BUDGET, CHUNK_MAX_OUTPUT_TOKENS, CONTEXT_TOKEN_BUDGET), max_workers, on_result, engine)
+
+    print(f'阶段统计: {metrics.summary()}')
+    report_validation_failures(failures, unique, os.path.join(JOURNAL_DIR, 'ftbquests.failed.json'))
+    unfinished = [rel_path for rel_path, quest_file in files.items() if quest_file['remaining'] > 0]
+    if failed or unfinished:
+        print(f'⚠️ {failed} 个分块翻译失败，{len(failures)} 个原文校验失败，{len(unfinished)} 个文件未完成，重新运行将跳过已翻译的原文')
+    else:
+        journal.remove()
 
 
 if __name__ == '__main__':
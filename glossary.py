@@ -0,0 +1,139 @@
+import json
+import os
+import re
+import threading
+
+from validation import FORMAT_CODE_PATTERN
+
+WORD_PATTERN = re.compile(r"[A-Za-z0-9]+(?:'[A-Za-z]+)?")
+STOP_WORDS = {
+    'a', 'an', 'the', 'of', 'to', 'in', 'on', 'at', 'by', 'for', 'and', 'or', 'is', 'it', 'be', 'as', 'with',
+    'this', 'that', 'you', 'your', 'can', 'will', 'not', 'are', 'from', 'if', 'when', 'all', 'no', 'yes',
+}
+
+
+def stem(word: str):
+    """简单的英文词形归一化：统一小写，去掉复数等常见屈折变化"""
+    word = word.lower()
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('ches', 'shes', 'sses', 'xes', 'zes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+def tokenize(text: str):
+    """将文本切分为 (归一化词, 起始位置, 结束位置) 列表"""
+    text = FORMAT_CODE_PATTERN.sub('  ', text)
+    return [(stem(m.group()), m.start(), m.end()) for m in WORD_PATTERN.finditer(text)]
+
+
+class Glossary:
+    """
+    基于 Aho-Corasick 自动机的术语匹配器，以归一化后的单词为字母表，
+    一次线性扫描即可找出文本中出现的所有已知术语，只在单词边界处匹配
+    """
+
+    def __init__(self, translation_map: dict, max_words=6):
+        self.terms = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        patterns = {}
+        for en_value, zh_value in translation_map.items():
+            if not isinstance(en_value, str) or not isinstance(zh_value, str):
+                continue
+            words = tuple(word for word, _, _ in tokenize(en_value))
+            if not words or len(words) > max_words:
+                continue
+            if len(words) == 1 and (words[0] in STOP_WORDS or len(words[0]) < 3 or words[0].isdigit()):
+                continue
+            patterns.setdefault(words, []).append(len(self.terms))
+            self.terms.append(f"{en_value}={zh_value}")
+        for words, term_ids in patterns.items():
+            self._add(words, term_ids)
+        self._build()
+
+    def _add(self, words, term_ids):
+        node = 0
+        for word in words:
+            next_node = self._goto[node].get(word)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][word] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append((len(words), term_ids))
+
+    def _build(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for word, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(word, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def match(self, text: str, max_per_term=3):
+        """
+        找出文本中的所有已知术语
+        :return: (参考列表 key=value, 被术语覆盖的单词起始位置集合)
+        """
+        tokens = tokenize(text)
+        references = {}
+        covered = set()
+        node = 0
+        for i, (word, _, _) in enumerate(tokens):
+            while node and word not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(word, 0)
+            for length, term_ids in self._output[node]:
+                covered.update(tokens[j][1] for j in range(i - length + 1, i + 1))
+                for term_id in term_ids[:max_per_term]:
+                    references[self.terms[term_id]] = None
+        return list(references), covered
+
+    def unmatched_proper_nouns(self, text: str, covered):
+        """
+        找出没有被任何术语覆盖的专有名词（首字母大写且不在句首的单词），作为兜底检索的候选
+        """
+        words = []
+        for m in WORD_PATTERN.finditer(FORMAT_CODE_PATTERN.sub('  ', text)):
+            word = m.group()
+            if not word[0].isupper() or word.lower() in STOP_WORDS:
+                continue
+            if m.start() in covered:
+                continue
+            before = text[max(0, m.start() - 16):m.start()].rstrip()
+            if not before or before[-1] in '.!?:\n#"-':
+                continue
+            words.append(word)
+        return list(dict.fromkeys(words))
+
+
+_glossaries = {}
+_glossary_lock = threading.Lock()
+
+
+def load_glossary(translation_map_file):
+    """加载并缓存术语匹配器，文件修改后重新构建"""
+    if not os.path.exists(translation_map_file):
+        return Glossary({})
+    mtime = os.path.getmtime(translation_map_file)
+    with _glossary_lock:
+        cached = _glossaries.get(translation_map_file)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(translation_map_file, 'r', encoding='utf-8') as f:
+            glossary = Glossary(json.load(f))
+        _glossaries[translation_map_file] = (mtime, glossary)
+        print(f"术语表已加载: {len(glossary.terms)} 条")
+        return glossary
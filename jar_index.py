@@ -0,0 +1,95 @@
+import fnmatch
+import hashlib
+import json
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from config import JAR_INDEX_FILE
+
+# 索引记录的资源类型和匹配规则
+ASSET_PATTERNS = {
+    'lang': ['assets/*lang/en_us.json', 'assets/*lang/zh_cn.json', 'assets/*lang/en_us.lang', 'assets/*lang/zh_cn.lang'],
+    'ae2guide': ['assets/*/ae2guide/*.md'],
+}
+
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def scan_jar(jar_path):
+    """
+    扫描单个 jar，记录其中的语言文件、AE2 手册和资源命名空间
+    """
+    stat = os.stat(jar_path)
+    entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha1': file_sha1(jar_path)}
+    try:
+        with zipfile.ZipFile(jar_path, 'r') as zip_ref:
+            file_list = zip_ref.namelist()
+    except zipfile.BadZipFile:
+        entry['error'] = 'bad zip'
+        return entry
+    for kind, patterns in ASSET_PATTERNS.items():
+        entry[kind] = [f for f in file_list if any(fnmatch.fnmatch(f, pattern) for pattern in patterns)]
+    entry['namespaces'] = sorted({f.split('/', 2)[1] for f in file_list if f.startswith('assets/') and f.count('/') >= 2})
+    return entry
+
+def list_jars(mods_dir):
+    jars = []
+    for zip_file in os.listdir(mods_dir):
+        zip_path = os.path.join(mods_dir, zip_file)
+        if zip_path.endswith(".jar") or zip_path.endswith(".zip"):
+            jars.append(zip_path)
+    return jars
+
+def build_jar_index(mods_dir, index_file=JAR_INDEX_FILE, max_workers=None):
+    """
+    为 mods 目录建立 jar 索引，大小和修改时间未变的 jar 直接复用上次的扫描结果，
+    其余的 jar 在进程池中并行扫描，结果持久化到 index_file
+    :return: jar 路径 -> 索引条目，顺序与 os.listdir 一致
+    """
+    previous = {}
+    if os.path.exists(index_file):
+        with open(index_file, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+
+    index = {}
+    to_scan = []
+    for jar_path in list_jars(mods_dir):
+        stat = os.stat(jar_path)
+        cached = previous.get(jar_path)
+        if cached and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime:
+            index[jar_path] = cached
+        else:
+            index[jar_path] = None
+            to_scan.append(jar_path)
+
+    if to_scan:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for jar_path, entry in zip(to_scan, executor.map(scan_jar, to_scan, chunksize=4)):
+                index[jar_path] = entry
+    print(f"jar 索引: 共 {len(index)} 个，重新扫描 {len(to_scan)} 个")
+
+    if to_scan or len(index) != len(previous):
+        index_dir = os.path.dirname(index_file)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+        with open(index_file, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+    return index
+
+def iter_indexed_files(index, kind, pattern='*'):
+    """
+    遍历索引中某类资源，返回 (jar 路径, [匹配 pattern 的文件])，跳过损坏和不含该资源的 jar
+    """
+    for jar_path, entry in index.items():
+        if entry.get('error'):
+            print(f"跳过损坏的 ZIP 文件: {jar_path}")
+            continue
+        files = [f for f in entry.get(kind, []) if fnmatch.fnmatch(f, pattern)]
+        if files:
+            yield jar_path, files
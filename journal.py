@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class TranslationJournal:
+    """
+    只追加的翻译日志，每完成一个分块写入一行 JSON，
+    每 fsync_every 次写入执行一次 fsync，中断后可以从日志恢复已完成的结果。
+    写入时提供原文则同时记录原文的哈希，恢复时跳过原文已经变化的条目
+    """
+
+    def __init__(self, journal_file, fsync_every=8):
+        self.journal_file = journal_file
+        self.fsync_every = fsync_every
+        self._pending_sync = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self, sources: dict | None = None):
+        """
+        读取日志中所有已完成的结果，忽略中断时写了一半的最后一行
+        :param sources: 当前的 key -> 原文，提供时只恢复原文哈希一致的条目
+        """
+        done = {}
+        if not os.path.exists(self.journal_file):
+            return done
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"跳过损坏的日志记录: {self.journal_file}")
+                    continue
+                if sources is None:
+                    done.update(record.get('translations', {}) if 'translations' in record else record)
+                    continue
+                # 没有原文哈希的旧记录无法确认，和原文变化的条目一样重新翻译
+                hashes = record.get('sources', {})
+                for key, value in record.get('translations', {}).items():
+                    if key in sources and hashes.get(key) == source_hash(sources[key]):
+                        done[key] = value
+        return done
+
+    def append(self, result: dict, sources: dict | None = None):
+        """
+        :param sources: key -> 原文，提供时与译文一起记录原文的哈希
+        """
+        if not result:
+            return
+        if sources is not None:
+            result = {'translations': result, 'sources': {key: source_hash(sources[key]) for key in result if key in sources}}
+        with self._lock:
+            if self._file is None:
+                journal_dir = os.path.dirname(self.journal_file)
+                if journal_dir:
+                    os.makedirs(journal_dir, exist_ok=True)
+                self._file = open(self.journal_file, 'a', encoding='utf-8')
+            self._file.write(json.dumps(result, ensure_ascii=False) + '\n')
+            self._file.flush()
+            self._pending_sync += 1
+            if self._pending_sync >= self.fsync_every:
+                os.fsync(self._file.fileno())
+                self._pending_sync = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+                self._pending_sync = 0
+
+    def remove(self):
+        """结果已经完整写入最终文件后删除日志"""
+        self.close()
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def source_hash(value):
+    return hashlib.sha1(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()[:16]
+
+def write_text_atomic(output_file, content):
+    """先写临时文件再替换，避免中断时留下写了一半的输出文件"""
+    tmp_file = output_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_file, output_file)
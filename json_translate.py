@@ -2,89 +2,106 @@ import json
 import os
 import shutil
 
-from ai_translate import build_translate_embed, translate_json
-from config import MODS_DIR, VERSION_JSON, EN_OUT_DIR, ZH_OUT_DIR, MERGED_EN_FILE, MERGED_ZH_FILE, MERGED_MAP_FILE, WORK_DIR, CFPA_PATH, CFPA_PROJECT_VERSION
-from language_extract import extract_minecraft_langs, extract_mod_langs, merge_lang_json, generate_lang_map, extract_cfpa
+from ai_translate import build_translate_embed, translate_store
+from config import MODS_DIR, VERSION_JSON, EN_OUT_DIR, ZH_OUT_DIR, WORK_DIR, CFPA_PATH, CFPA_PROJECT_VERSION, \
+    REF_EN_OUT_DIR, REF_ZH_OUT_DIR, REF_MERGED_MAP_FILE, PIPELINE_STATE_FILE, VECTOR_BACKEND, VECTOR_MMAP_DTYPE, openai_embed_model, openai_embed_dimensions, \
+    TRANSLATION_STORE_FILE, RESOURCE_PACK_FILE, PREVIOUS_EN_PATH, PREVIOUS_TRANSLATED_PATH
+from delta import carry_forward_release
+from jar_index import build_jar_index
+from language_extract import extract_minecraft_langs, extract_mod_langs, extract_cfpa, cfpa_namespaces, merge_lang_dir
+from pipeline import Stage, run_pipeline, git_revision, jar_index_fingerprint
+from translation_store import TranslationStore
+from vector_index import mmap_index_meta
 
 
-def prepare():
-    # 1. 提取模组包、官方资源包、CFPA的翻译 json，存储到 en 和 zh 目录
-    extract_minecraft_langs(VERSION_JSON, EN_OUT_DIR, ZH_OUT_DIR)
-    extract_mod_langs(MODS_DIR, EN_OUT_DIR, ZH_OUT_DIR)
-    extract_cfpa(CFPA_PATH, CFPA_PROJECT_VERSION, EN_OUT_DIR, ZH_OUT_DIR)
+def prepare(force=False):
+    """
+    准备翻译所需的文件，各阶段记录输入和输出的指纹，输入没有变化的阶段会被跳过
+    :param force: 忽略记录，重新执行所有阶段
+    """
+    jar_index = build_jar_index(MODS_DIR)
+    jar_set = lambda: jar_index_fingerprint(jar_index)
+    store = TranslationStore(TRANSLATION_STORE_FILE)
+    exist_translated_file = WORK_DIR + '/exist_translated.json'
 
-    # 2. 合并语言文件
-    merge_lang_json(ZH_OUT_DIR, MERGED_ZH_FILE)
-    merge_lang_json(EN_OUT_DIR, MERGED_EN_FILE)
+    def reset_dirs(*dirs):
+        for directory in dirs:
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
 
-    # 3. 创建映射文件
-    generate_lang_map(
-        MERGED_EN_FILE,
-        MERGED_ZH_FILE,
-        MERGED_MAP_FILE,
-        WORK_DIR + '/untranslated.json',
-        WORK_DIR + '/exist_translated.json' # 追加额外已翻译的文本用于参考
-    )
+    # 1. 提取整合包中的模组语言文件，每次准备只解压一次 JAR，参考目录和翻译存储共用提取结果
+    def extract_mods():
+        reset_dirs(EN_OUT_DIR, ZH_OUT_DIR)
+        extract_mod_langs(MODS_DIR, EN_OUT_DIR, ZH_OUT_DIR, jar_index=jar_index)
 
-    # 4. 创建向量索引
-    build_translate_embed(MERGED_MAP_FILE)
+    # 2. 合并官方资源包、模组、CFPA的翻译 json，存储到参考的 en 和 zh 目录
+    def extract_reference():
+        reset_dirs(REF_EN_OUT_DIR, REF_ZH_OUT_DIR)
+        os.makedirs(REF_EN_OUT_DIR, exist_ok=True)
+        os.makedirs(REF_ZH_OUT_DIR, exist_ok=True)
+        extract_minecraft_langs(VERSION_JSON, REF_EN_OUT_DIR, REF_ZH_OUT_DIR)
+        merge_lang_dir(EN_OUT_DIR, REF_EN_OUT_DIR)
+        merge_lang_dir(ZH_OUT_DIR, REF_ZH_OUT_DIR)
+        extract_cfpa(CFPA_PATH, CFPA_PROJECT_VERSION, REF_EN_OUT_DIR, REF_ZH_OUT_DIR)
 
-    # 5. 重新创建需要翻译的文件
-    shutil.rmtree(EN_OUT_DIR)
-    shutil.rmtree(ZH_OUT_DIR)
-    extract_mod_langs(MODS_DIR, EN_OUT_DIR, ZH_OUT_DIR)
-    merge_lang_json(ZH_OUT_DIR, MERGED_ZH_FILE)
-    merge_lang_json(EN_OUT_DIR, MERGED_EN_FILE)
-    generate_lang_map(
-        MERGED_EN_FILE,
-        MERGED_ZH_FILE,
-        MERGED_MAP_FILE,
-        WORK_DIR + '/untranslated.json'
-    )
+    # 3. 导入翻译存储，记录每条参考译文的来源，并导出 原文 -> 译文 映射
+    def import_reference():
+        cfpa = cfpa_namespaces(CFPA_PATH, CFPA_PROJECT_VERSION)
+        store.import_sources('reference', REF_EN_OUT_DIR, REF_ZH_OUT_DIR,
+                             lambda namespace: 'cfpa' if namespace in cfpa else 'minecraft' if namespace == 'minecraft' else 'mod')
+        # 追加额外已翻译的文本用于参考
+        if os.path.exists(exist_translated_file):
+            with open(exist_translated_file, 'r', encoding='utf-8') as f:
+                store.import_targets('reference', json.load(f), 'manual')
+        store.export_map('reference', REF_MERGED_MAP_FILE)
 
-def split_translated(translated_file, en_dir, out_dir):
-    # 存储每个键的命名空间
-    namespace_map = {}
+    # 4. 创建向量索引，使用 mmap 后端时同时导出内存映射矩阵
+    def embed_reference():
+        build_translate_embed(REF_MERGED_MAP_FILE)
 
-    # 遍历目录中的所有 JSON 文件
-    for filename in os.listdir(en_dir):
-        if filename.endswith('.json'):
-            namespace = filename.split('.', 1)[0]
-            file_path = os.path.join(en_dir, filename)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                try:
-                    data = json.load(f)
-                    # 合并对象
-                    for key, value in data.items():
-                        if key not in namespace_map:
-                            namespace_map[key] = namespace
-                except json.JSONDecodeError as e:
-                    print(f"解析文件 {filename} 时出错: {e}")
+    # 导出的矩阵可能很大，用元数据中的内容哈希作为指纹，任何一个文件缺失时为 None
+    embed_outputs = ['chroma/manifest.json']
+    if VECTOR_BACKEND == 'mmap':
+        embed_outputs.append(lambda: mmap_index_meta(os.path.join('chroma', 'mmap')))
 
-    translated_map = {}
-    # 读取已翻译文件
-    with open(translated_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        for key, value in data.items():
-            known_namespace = namespace_map.get(key)
-            if known_namespace is None:
-                known_namespace = 'unknown'
-            if known_namespace in translated_map:
-                translated_map[known_namespace][key] = value
-            else:
-                translated_map[known_namespace] = {key: value}
-    for namespace, translations in translated_map.items():
-        out_file = os.path.join(out_dir, namespace, 'lang', 'zh_cn.json')
-        out_basedir = os.path.dirname(out_file)
-        os.makedirs(out_basedir, exist_ok=True)
-        results = dict(sorted(translations.items()))
-        with open(out_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=4)
+    # 5. 整合包的语言文件导入翻译存储，原文没有变化的条目保留已有译文
+    def import_mods():
+        store.import_sources('pack', EN_OUT_DIR, ZH_OUT_DIR)
+        print(f"翻译存储: {store.stats('pack')}")
 
+    stages = [
+        Stage('extract_mods', extract_mods,
+              inputs={'jars': jar_set},
+              outputs=[EN_OUT_DIR, ZH_OUT_DIR]),
+        Stage('extract_ref', extract_reference,
+              inputs={'en': EN_OUT_DIR, 'zh': ZH_OUT_DIR, 'version': VERSION_JSON, 'cfpa': lambda: git_revision(CFPA_PATH)},
+              outputs=[REF_EN_OUT_DIR, REF_ZH_OUT_DIR],
+              params={'cfpa_version': CFPA_PROJECT_VERSION}),
+        Stage('import_ref', import_reference,
+              inputs={'en': REF_EN_OUT_DIR, 'zh': REF_ZH_OUT_DIR, 'exist': exist_translated_file},
+              outputs=[REF_MERGED_MAP_FILE, lambda: store.get_meta('reference_import')]),
+        Stage('embed', embed_reference,
+              inputs={'map': REF_MERGED_MAP_FILE},
+              outputs=embed_outputs,
+              params={'embed_model': openai_embed_model, 'dimensions': openai_embed_dimensions, 'backend': VECTOR_BACKEND,
+                      'mmap_dtype': VECTOR_MMAP_DTYPE}),
+        Stage('import_mods', import_mods,
+              inputs={'en': EN_OUT_DIR, 'zh': ZH_OUT_DIR},
+              outputs=[lambda: store.get_meta('pack_import')]),
+    ]
+    return run_pipeline(stages, PIPELINE_STATE_FILE, force)
 
-def do_translate():
-    translate_json(WORK_DIR + '/untranslated.json', WORK_DIR + '/translated.json')
-    split_translated(WORK_DIR + '/translated.json', EN_OUT_DIR, WORK_DIR + '/translated')
+def do_translate(max_workers=8, engine=None):
+    """
+    翻译存储中整合包的未翻译条目，再按命名空间导出 json 并打包为资源包，
+    配置了上一个版本的原文和译文时，先沿用原文没有变化的键的译文
+    """
+    store = TranslationStore(TRANSLATION_STORE_FILE)
+    if PREVIOUS_EN_PATH and PREVIOUS_TRANSLATED_PATH:
+        carry_forward_release(store, PREVIOUS_EN_PATH, PREVIOUS_TRANSLATED_PATH, 'pack', WORK_DIR + '/delta_report.json')
+    translate_store(store, 'pack', max_workers=max_workers, engine=engine)
+    store.export_namespaces('pack', WORK_DIR + '/translated')
+    store.export_resource_pack('pack', RESOURCE_PACK_FILE)
 
 if __name__ == '__main__':
     prepare()
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+# 只由 XML 标签组成的块，如 <ItemImage id="..." /> 或 <Row> ... </Row>，原样保留
+# 标签之间的空白只由一个量词匹配，避免嵌套量词在以文本结尾的长标签块上指数级回溯
+TAG_ONLY_PATTERN = re.compile(r'^\s*(?:<[^<>]+>\s*)+$')
+FENCE_PATTERN = re.compile(r'^\s*(```|~~~)')
+
+
+def split_markdown(document: str):
+    """
+    将 markdown 文档切分为片段列表，每个片段为 (文本, 是否需要翻译)，
+    所有片段的文本按顺序拼接后与原文完全一致：
+    开头的 --- 元数据、标题、段落需要翻译；代码块、纯标签块和空行原样保留
+    """
+    lines = document.splitlines(keepends=True)
+    segments = []
+    block = []
+
+    def flush():
+        if block:
+            text = ''.join(block)
+            segments.append((text, not TAG_ONLY_PATTERN.match(text)))
+            block.clear()
+
+    i = 0
+    # 元数据
+    if lines and lines[0].strip() == '---':
+        for j in range(1, len(lines)):
+            if lines[j].strip() == '---':
+                segments.append((''.join(lines[:j + 1]), True))
+                i = j + 1
+                break
+
+    while i < len(lines):
+        line = lines[i]
+        if FENCE_PATTERN.match(line):
+            # 代码块原样保留
+            flush()
+            fence = FENCE_PATTERN.match(line).group(1)
+            j = i + 1
+            while j < len(lines) and not lines[j].lstrip().startswith(fence):
+                j += 1
+            segments.append((''.join(lines[i:j + 1]), False))
+            i = j + 1
+            continue
+        if not line.strip():
+            flush()
+            segments.append((line, False))
+        elif line.lstrip().startswith('#'):
+            flush()
+            segments.append((line, True))
+        else:
+            block.append(line)
+        i += 1
+    flush()
+    return segments
+
+def restore_whitespace(source: str, translated: str):
+    """保留原片段首尾的空白，避免模型输出改变段落间距"""
+    leading = source[:len(source) - len(source.lstrip())]
+    trailing = source[len(source.rstrip()):]
+    return leading + translated.strip() + trailing
+
+def segment_key(text: str, model: str):
+    return hashlib.sha1(f"{model}\0{text.strip()}".encode('utf-8')).hexdigest()
+
+
+class SegmentCache:
+    """按片段内容哈希缓存译文，原文未变化的段落不会被重新翻译"""
+
+    def __init__(self, cache_file):
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS segments (key TEXT PRIMARY KEY, translated TEXT NOT NULL)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT translated FROM segments WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, translated):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO segments (key, translated) VALUES (?, ?)", (key, translated))
+            self._conn.commit()
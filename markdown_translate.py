@@ -1,32 +1,29 @@
 import fnmatch
+import hashlib
+import json
 import os
 import zipfile
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from ai_translate import translate_document, load_translate_embed
-from config import MODS_DIR, AE2_EN_OUT_DIR, AE2_ZH_OUT_DIR
+from ai_translate import build_document_graph, translate_document, atranslate_document, dispatch_translate_chunks
+from config import MODS_DIR, AE2_EN_OUT_DIR, AE2_ZH_OUT_DIR, AE2_SEGMENT_CACHE_FILE, AE2_MANIFEST_FILE, CONTEXT_TOKEN_BUDGET, openai_llm_model
+from jar_index import build_jar_index, iter_indexed_files
+from journal import write_text_atomic
+from metrics import metrics
+from scheduler import schedule, text_cost
+from markdown_segment import split_markdown, restore_whitespace, segment_key, SegmentCache
 
 
 # AE2 手册的翻译
-def extract_ae2_markdown(mods_dir, en_output_dir):
+def extract_ae2_markdown(mods_dir, en_output_dir, jar_index=None):
     # 创建输出目录
     os.makedirs(en_output_dir, exist_ok=True)
 
-    # 遍历 JAR 文件
-    for zip_file in os.listdir(mods_dir):
-        zip_path = os.path.join(mods_dir, zip_file)
-        if not zip_path.endswith(".jar") and not zip_path.endswith(".zip"):
-            continue
-
+    # 只打开索引中包含 AE2 手册的 JAR
+    index = jar_index if jar_index is not None else build_jar_index(mods_dir)
+    for zip_path, md_files in iter_indexed_files(index, 'ae2guide'):
         try:
             with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                # 获取 ZIP 中所有文件名
-                file_list = zip_ref.namelist()
-
-                suffix = ".md"
-                md_files = [f for f in file_list if fnmatch.fnmatch(f, f"assets/*/ae2guide/*{suffix}")]
-
-                # 提取 en_us.lang 文件并转换为 JSON
+                # 提取手册 markdown 文件
                 for md_file in md_files:
                     new_path = md_file.removeprefix("assets/")
                     if fnmatch.fnmatch(new_path, "*/ae2guide/_*"):
@@ -47,46 +44,99 @@ def extract_ae2_markdown(mods_dir, en_output_dir):
         except Exception as e:
             print(f"处理 ZIP 文件时出错: {zip_path}, 错误: {e}")
 
-def translate_ae2_markdown(en_output_dir, zh_output_dir):
-    def translate_worker(input_document, rel_path, output_file):
-        dir_path = os.path.dirname(output_file)
-        os.makedirs(dir_path, exist_ok=True)
-        print(f"处理中: {rel_path}")
-        zh_document = translate_document(input_document)
+def translate_ae2_markdown(en_output_dir, zh_output_dir, max_workers=12, engine=None):
+    """
+    按段落翻译 AE2 手册：页面被切分为元数据、标题、段落等片段，代码块和标签块原样保留，
+    片段按内容哈希缓存，所有页面的待翻译片段去重后并发翻译，页面的片段全部完成后立即写入
+    """
+    graph = build_document_graph()
+    cache = SegmentCache(AE2_SEGMENT_CACHE_FILE)
+    manifest = {}
+    if os.path.exists(AE2_MANIFEST_FILE):
+        with open(AE2_MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    def save_manifest():
+        write_text_atomic(AE2_MANIFEST_FILE, json.dumps(manifest, ensure_ascii=False, indent=2))
+
+    def write_page(rel_path, page):
+        zh_document = ''.join(page['translated'])
         print(f"处理完成: {rel_path}")
-        print(zh_document)
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(zh_document)
-        return True
+        # 原子写入，中断时不会留下半个文件导致下次被当作已完成跳过
+        write_text_atomic(page['output_file'], zh_document)
+        manifest[rel_path] = page['source_hash']
+        save_manifest()
+
+    total = 0
+    finished = 0
+    pages = {}
+    # 片段键 -> 原文和所有引用该片段的 (页面, 位置)
+    waiting = {}
+    for root, paths, files in os.walk(en_output_dir):
+        for file in files:
+            total += 1
+            full_path = os.path.join(root, file)
+            rel_path = os.path.relpath(full_path, en_output_dir).replace(os.sep, '/').removeprefix('/')
+            namespace = rel_path.split('/', 1)[0]
+            file_path = rel_path.removeprefix(f'{namespace}/ae2guide/')
+            zh_cn_file_path = os.path.join(zh_output_dir, f'{namespace}/ae2guide/_zh_cn', file_path)
+            with open(full_path, 'r', encoding='utf-8') as f:
+                en_document = f.read()
+            source_hash = hashlib.sha1(en_document.encode('utf-8')).hexdigest()
+            if os.path.exists(zh_cn_file_path) and manifest.setdefault(rel_path, source_hash) == source_hash:
+                # 原文没有变化，或者是没有记录的旧译文
+                finished += 1
+                continue
+            os.makedirs(os.path.dirname(zh_cn_file_path), exist_ok=True)
 
-    with ThreadPoolExecutor(max_workers=12) as executor:
-        total = 0
-        finished = 0
-        futures = []
-        for root, paths, files in os.walk(en_output_dir):
-            for file in files:
-                total += 1
-                full_path = os.path.join(root, file)
-                rel_path = os.path.relpath(full_path, en_output_dir).replace(os.sep, '/').removeprefix('/')
-                namespace = rel_path.split('/', 1)[0]
-                file_path = rel_path.removeprefix(f'{namespace}/ae2guide/')
-                zh_cn_file_path = os.path.join(zh_output_dir, f'{namespace}/ae2guide/_zh_cn', file_path)
-                if os.path.exists(zh_cn_file_path):
-                    finished += 1
+            segments = split_markdown(en_document)
+            page = {'output_file': zh_cn_file_path, 'source_hash': source_hash, 'translated': [], 'remaining': 0}
+            for index, (text, need_translate) in enumerate(segments):
+                if not need_translate:
+                    page['translated'].append(text)
                     continue
-                zh_cn_dir_path = os.path.dirname(zh_cn_file_path)
-                os.makedirs(zh_cn_dir_path, exist_ok=True)
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    en_document = f.read()
+                key = segment_key(text, openai_llm_model)
+                cached = cache.get(key)
+                if cached is not None:
+                    metrics.inc("segment_cache_hits")
+                    page['translated'].append(restore_whitespace(text, cached))
+                else:
+                    page['translated'].append(None)
+                    page['remaining'] += 1
+                    waiting.setdefault(key, {'key': key, 'text': text, 'targets': []})['targets'].append((rel_path, index))
+            if page['remaining'] == 0:
+                write_page(rel_path, page)
+                finished += 1
+            else:
+                pages[rel_path] = page
+    save_manifest()
+    print(f'待翻译页面: {len(pages)}, 待翻译片段: {len(waiting)}')
+
+    def translate_worker(item):
+        return item, translate_document(item['text'], graph=graph)
+
+    async def atranslate_worker(item):
+        return item, await atranslate_document(item['text'], graph)
 
-                future = executor.submit(translate_worker, en_document, rel_path, zh_cn_file_path)
-                futures.append(future)
+    def on_result(result):
+        nonlocal finished
+        item, zh_text = result
+        cache.put(item['key'], zh_text)
+        for rel_path, index in item['targets']:
+            page = pages[rel_path]
+            page['translated'][index] = restore_whitespace(item['text'], zh_text)
+            page['remaining'] -= 1
+            if page['remaining'] == 0:
+                write_page(rel_path, page)
+                finished += 1
+                print(f'进度: {finished}/{total}')
 
-        for future in as_completed(futures):
-            result = future.result()
-            finished += 1
-            print(f'进度: {finished}/{total}')
-            print()
+    # 最长的片段最先开始，避免大段落最后才开始拖长总耗时
+    items = schedule(waiting.values(), lambda item: text_cost(item['text'], CONTEXT_TOKEN_BUDGET))
+    failed = dispatch_translate_chunks(translate_worker, atranslate_worker, items, max_workers, on_result, engine)
+    print(f'阶段统计: {metrics.summary()}')
+    if failed:
+        print(f'⚠️ {failed} 个片段翻译失败，重新运行将只翻译这些片段')
 
 
 if __name__ == '__main__':
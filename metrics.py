@@ -0,0 +1,163 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from config import METRICS_TRACE_FILE, METRICS_SUMMARY_FILE, METRICS_EXPORT_INTERVAL, METRICS_TRACE_MAX_BYTES
+from journal import write_text_atomic
+
+PROMETHEUS_PREFIX = 'mc_translate_'
+
+
+class Metrics:
+    """
+    进程内的指标和追踪：
+    计数器、瞬时值和各阶段耗时，耗时事件逐条写入 JSONL 追踪文件，
+    汇总定期以 Prometheus 文本格式写入 summary_file，文件路径为空时不输出。
+    每次运行覆盖上次的追踪文件，超过 trace_max_bytes 时轮换
+    """
+
+    def __init__(self, trace_file=None, summary_file=None, export_interval=10.0, trace_max_bytes=0):
+        self.trace_file = trace_file
+        self.summary_file = summary_file
+        self.export_interval = export_interval
+        self.trace_max_bytes = trace_max_bytes
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        # 阶段名 -> [次数, 总耗时, 最大耗时]
+        self._timings = {}
+        self._collectors = []
+        self._trace = None
+        self._trace_opened = False
+        self._last_export = time.monotonic()
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def register_collector(self, collect):
+        """导出时调用 collect() 读取 名称 -> 数值，用于缓存命中率等由其他对象维护的统计"""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def event(self, name, **attrs):
+        """写入一条追踪事件"""
+        if not self.trace_file:
+            return
+        line = json.dumps({'ts': round(time.time(), 6), 'event': name, **attrs}, ensure_ascii=False)
+        with self._lock:
+            if self._trace is None:
+                trace_dir = os.path.dirname(self.trace_file)
+                if trace_dir:
+                    os.makedirs(trace_dir, exist_ok=True)
+                self._trace = open(self.trace_file, 'a' if self._trace_opened else 'w', encoding='utf-8')
+                self._trace_opened = True
+            self._trace.write(line + '\n')
+
+    def observe(self, name, seconds, **attrs):
+        with self._lock:
+            timing = self._timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+        self.event(name, seconds=round(seconds, 6), **attrs)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """记录代码块的耗时，抛出异常时在追踪事件中记录错误"""
+        start = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs['error'] = type(e).__name__
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **attrs)
+
+    def timed(self, name):
+        """函数装饰器，同步和异步函数都记录耗时，保留原函数名"""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            timings = {name: list(values) for name, values in self._timings.items()}
+            collectors = list(self._collectors)
+        for collect in collectors:
+            try:
+                gauges.update(collect())
+            except Exception as e:
+                print(f"读取指标失败: {e}")
+        return {'counters': counters, 'gauges': gauges, 'timings': timings}
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = f'{PROMETHEUS_PREFIX}{name}_total'
+            lines += [f'# TYPE {metric} counter', f'{metric} {value}']
+        for name, value in sorted(snapshot['gauges'].items()):
+            if isinstance(value, (int, float)):
+                metric = PROMETHEUS_PREFIX + name
+                lines += [f'# TYPE {metric} gauge', f'{metric} {value}']
+        if snapshot['timings']:
+            metric = f'{PROMETHEUS_PREFIX}stage_seconds'
+            lines.append(f'# TYPE {metric} summary')
+            for name, (count, total, maximum) in sorted(snapshot['timings'].items()):
+                lines.append(f'{metric}_count{{stage="{name}"}} {count}')
+                lines.append(f'{metric}_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'# TYPE {metric}_max gauge')
+            for name, (count, total, maximum) in sorted(snapshot['timings'].items()):
+                lines.append(f'{metric}_max{{stage="{name}"}} {maximum:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        """关闭追踪文件（下一条事件时重新打开）并写出汇总"""
+        with self._lock:
+            self._last_export = time.monotonic()
+            if self._trace:
+                self._trace.close()
+                self._trace = None
+                if self.trace_max_bytes and os.path.getsize(self.trace_file) > self.trace_max_bytes:
+                    os.replace(self.trace_file, self.trace_file + '.1')
+                    self._trace_opened = False
+        if self.summary_file:
+            write_text_atomic(self.summary_file, self.to_prometheus())
+
+    def maybe_export(self):
+        """距离上次导出超过 export_interval 秒时导出，在每个分块完成后调用"""
+        if time.monotonic() - self._last_export >= self.export_interval:
+            self.export()
+
+    def summary(self):
+        """各阶段耗时的简短文本，用于任务结束时打印"""
+        snapshot = self.snapshot()
+        parts = [f'{name}: {count} 次 共 {total:.1f} 秒' for name, (count, total, _) in sorted(snapshot['timings'].items())]
+        parts += [f'{name}: {value}' for name, value in sorted(snapshot['counters'].items())]
+        return ', '.join(parts)
+
+
+# 进程内共享的指标
+metrics = Metrics(METRICS_TRACE_FILE, METRICS_SUMMARY_FILE, METRICS_EXPORT_INTERVAL, METRICS_TRACE_MAX_BYTES)
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import time
+
+
+def file_fingerprint(path):
+    """文件按内容计算哈希，目录按其中所有文件的相对路径和内容计算，不存在时返回 missing"""
+    if os.path.isfile(path):
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha1.update(block)
+        return sha1.hexdigest()
+    if os.path.isdir(path):
+        sha1 = hashlib.sha1()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file in sorted(files):
+                full_path = os.path.join(root, file)
+                sha1.update(os.path.relpath(full_path, path).encode('utf-8'))
+                sha1.update(file_fingerprint(full_path).encode('utf-8'))
+        return sha1.hexdigest()
+    return 'missing'
+
+def git_revision(repo_dir):
+    """读取 git 仓库当前的提交，不是 git 仓库时退回到目录指纹"""
+    git_dir = os.path.join(repo_dir, '.git')
+    head_file = os.path.join(git_dir, 'HEAD')
+    if not os.path.isfile(head_file):
+        return file_fingerprint(repo_dir)
+    with open(head_file, 'r', encoding='utf-8') as f:
+        head = f.read().strip()
+    if not head.startswith('ref: '):
+        return head
+    ref = head.removeprefix('ref: ')
+    ref_file = os.path.join(git_dir, ref)
+    if os.path.isfile(ref_file):
+        with open(ref_file, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    packed_refs = os.path.join(git_dir, 'packed-refs')
+    if os.path.isfile(packed_refs):
+        with open(packed_refs, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.strip().split(' ', 1)
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+    return 'missing'
+
+def jar_index_fingerprint(index):
+    """jar 集合的指纹，由每个 jar 的路径和内容哈希组成"""
+    sha1 = hashlib.sha1()
+    for jar_path in sorted(index):
+        sha1.update(f"{jar_path}\0{index[jar_path].get('sha1')}\n".encode('utf-8'))
+    return sha1.hexdigest()
+
+
+class Stage:
+    """
+    构建流程中的一个阶段
+    :param name: 阶段名
+    :param run: 执行函数
+    :param inputs: 输入，值为字符串时视为文件或目录路径，为可调用对象时使用其返回值作为指纹
+    :param outputs: 输出的文件或目录路径，为可调用对象时使用其返回值作为指纹
+    :param params: 影响结果的参数，参数变化时阶段会重新执行
+    """
+
+    def __init__(self, name, run, inputs=None, outputs=(), params=None):
+        self.name = name
+        self.run = run
+        self.inputs = inputs or {}
+        self.outputs = list(outputs)
+        self.params = params or {}
+
+    def input_fingerprint(self):
+        values = {'params': self.params}
+        for input_name, source in self.inputs.items():
+            values[input_name] = source() if callable(source) else file_fingerprint(source)
+        return hashlib.sha1(json.dumps(values, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def output_fingerprint(self):
+        fingerprints = {}
+        for index, output in enumerate(self.outputs):
+            if callable(output):
+                fingerprints[f'output{index}'] = output()
+            else:
+                fingerprints[output] = file_fingerprint(output)
+        return fingerprints
+
+
+def run_pipeline(stages, state_file, force=False):
+    """
+    按顺序执行各阶段，输入指纹和输出指纹都与上次记录一致的阶段会被跳过，
+    结束后打印每个阶段的耗时和跳过情况
+    """
+    state = {}
+    if not force and os.path.exists(state_file):
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+    report = []
+    for stage in stages:
+        start = time.perf_counter()
+        input_fingerprint = stage.input_fingerprint()
+        recorded = state.get(stage.name)
+        if recorded and recorded['inputs'] == input_fingerprint and recorded['outputs'] == stage.output_fingerprint():
+            report.append((stage.name, '跳过', time.perf_counter() - start))
+            continue
+
+        print(f"▶ 执行阶段: {stage.name}")
+        stage.run()
+        state[stage.name] = {'inputs': input_fingerprint, 'outputs': stage.output_fingerprint()}
+
+        state_dir = os.path.dirname(state_file)
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        with open(state_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        report.append((stage.name, '执行', time.perf_counter() - start))
+
+    print("\n阶段           状态    耗时(秒)")
+    for name, status, elapsed in report:
+        print(f"{name:<14} {status:<6} {elapsed:8.2f}")
+    return report
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import threading
+
+import httpx
+from chromadb import Settings
+from langchain_chroma import Chroma
+from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from pydantic import SecretStr
+
+import config
+from embed_cache import CachedEmbeddings
+from metrics import metrics
+from vector_index import load_mmap_index
+
+# 进程内共享的客户端和向量库，按参数懒加载
+_resources = {}
+_request_counts = {}
+_lock = threading.RLock()
+# 异步引擎共用的事件循环，共享的 httpx.AsyncClient 绑定在第一次使用它的循环上
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_or_create(key, factory):
+    with _lock:
+        resource = _resources.get(key)
+        if resource is None:
+            resource = factory()
+            _resources[key] = resource
+        return resource
+
+def pool_size():
+    """连接池大小与配置的并发数一致"""
+    return config.HTTP_POOL_SIZE or max(config.ASYNC_MAX_CONCURRENCY, 16)
+
+def _count_request(base_url):
+    def hook(request):
+        with _lock:
+            _request_counts[base_url] = _request_counts.get(base_url, 0) + 1
+    return hook
+
+def _count_request_async(base_url):
+    sync_hook = _count_request(base_url)
+
+    async def hook(request):
+        sync_hook(request)
+    return hook
+
+def get_http_client(base_url) -> httpx.Client:
+    """每个接口地址一个保持连接的 HTTP 客户端，避免重复建立 TLS 连接"""
+    def create():
+        limits = httpx.Limits(max_connections=pool_size(), max_keepalive_connections=pool_size())
+        return httpx.Client(limits=limits, timeout=httpx.Timeout(600, connect=10), event_hooks={'request': [_count_request(base_url)]})
+    return _get_or_create(('http', base_url), create)
+
+def get_async_http_client(base_url) -> httpx.AsyncClient:
+    def create():
+        limits = httpx.Limits(max_connections=pool_size(), max_keepalive_connections=pool_size())
+        return httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(600, connect=10), event_hooks={'request': [_count_request_async(base_url)]})
+    return _get_or_create(('async_http', base_url), create)
+
+def run_coroutine(coro):
+    """
+    在进程内共享的事件循环中运行协程，代替 asyncio.run：
+    每次新建并关闭事件循环时，上一个循环中建立的连接会导致下一次运行报 Event loop is closed
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+        return _loop.run_until_complete(coro)
+
+def get_llm(**kwargs) -> ChatOpenAI:
+    """共享的大模型客户端，相同参数只创建一次"""
+    def create():
+        return ChatOpenAI(
+            base_url=config.openai_llm_base_url, api_key=SecretStr(config.openai_api_key), model=config.openai_llm_model,
+            http_client=get_http_client(config.openai_llm_base_url),
+            http_async_client=get_async_http_client(config.openai_llm_base_url),
+            **kwargs,
+        )
+    return _get_or_create(('llm', tuple(sorted(kwargs.items()))), create)
+
+def get_document_embeddings() -> OpenAIEmbeddings:
+    """
+    不带缓存的嵌入模型，用于构建参考索引：参考文档只嵌入一次，
+    写入查询缓存只会挤掉真正的查询向量
+    """
+    return _get_or_create(('document_embeddings',), lambda: OpenAIEmbeddings(
+        base_url=config.openai_embed_base_url, api_key=SecretStr(config.openai_api_key), model=config.openai_embed_model,
+        dimensions=config.openai_embed_dimensions, check_embedding_ctx_length=False,
+        http_client=get_http_client(config.openai_embed_base_url),
+        http_async_client=get_async_http_client(config.openai_embed_base_url),
+    ))
+
+def get_embeddings() -> CachedEmbeddings:
+    """共享的带缓存嵌入模型，用于检索时的查询"""
+    def create():
+        embeddings = CachedEmbeddings(get_document_embeddings(), config.openai_embed_model, config.openai_embed_dimensions, config.EMBED_CACHE_FILE, config.EMBED_CACHE_MAX_ENTRIES)
+        metrics.register_collector(lambda: {f'embed_cache_{name}': value for name, value in embeddings.stats().items()})
+        return embeddings
+    return _get_or_create(('embeddings',), create)
+
+def get_vectorstore(db_dir="chroma", backend=None):
+    """
+    共享的参考索引，backend 为 chroma 时使用 Chroma，为 mmap 时使用导出的内存映射向量矩阵
+    """
+    backend = backend or config.VECTOR_BACKEND
+    if backend == "mmap":
+        # mmap 索引自带版本检查，导出更新后会重新加载
+        return load_mmap_index(os.path.join(db_dir, "mmap"), get_embeddings())
+    # Chroma 的嵌入函数只在 add_documents 时使用，查询向量由 retrieval 通过 get_embeddings() 计算并缓存
+    return _get_or_create(('chroma', db_dir), lambda: Chroma(
+        collection_name="langchain", embedding_function=get_document_embeddings(), persist_directory=db_dir,
+        client_settings=Settings(is_persistent=True),
+    ))
+
+def pool_stats():
+    """
+    连接池统计：每个接口地址的请求数和当前打开的连接数
+    """
+    stats = {}
+    with _lock:
+        for key, resource in _resources.items():
+            if key[0] not in ('http', 'async_http'):
+                continue
+            pool = getattr(getattr(resource, '_transport', None), '_pool', None)
+            connections = getattr(pool, 'connections', [])
+            entry = stats.setdefault(key[1], {'requests': _request_counts.get(key[1], 0), 'pool_size': pool_size()})
+            entry[f'{key[0]}_connections'] = len(connections)
+    return stats
@@ -0,0 +1,118 @@
+import json
+import os
+
+from config import SEARCH_CACHE_MAX_ENTRIES
+from embed_cache import SearchCache
+from metrics import metrics
+from resources import get_embeddings
+from vector_index import MmapVectorIndex
+
+# 进程内共享的检索结果缓存
+search_cache = SearchCache(SEARCH_CACHE_MAX_ENTRIES)
+metrics.register_collector(lambda: {f'search_cache_{name}': value for name, value in search_cache.stats().items()})
+
+
+def invalidate_search_cache():
+    """参考索引更新后调用，丢弃所有缓存的检索结果"""
+    search_cache.invalidate()
+
+# 清单文件 -> (修改时间, 内容哈希)
+_manifest_hashes = {}
+
+
+def manifest_content_hash(db_dir):
+    """Chroma 索引清单中记录的内容哈希，清单文件没有变化时不重复读取"""
+    manifest_file = os.path.join(db_dir, "manifest.json")
+    try:
+        mtime = os.stat(manifest_file).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _manifest_hashes.get(manifest_file)
+    if cached is None or cached[0] != mtime:
+        with open(manifest_file, "r", encoding="utf-8") as f:
+            cached = (mtime, json.load(f).get("content_hash"))
+        _manifest_hashes[manifest_file] = cached
+    return cached[1]
+
+def backend_version(vectorstore):
+    """返回 (索引标识, 版本)，版本由嵌入模型和索引内容哈希组成，变化时检索缓存失效"""
+    model = get_embeddings().model
+    if isinstance(vectorstore, MmapVectorIndex):
+        return vectorstore.id, (model, vectorstore.version)
+    collection = vectorstore._collection
+    persist_directory = getattr(vectorstore, "_persist_directory", None)
+    content_hash = manifest_content_hash(persist_directory) if persist_directory else None
+    # 没有清单（不是由 build_translate_embed 构建的索引）时退回条目数
+    return collection.id, (model, content_hash or collection.count())
+
+def query_backend(vectorstore, embeddings, k):
+    """对一批查询向量执行检索，返回每个查询的 [(key=value 文本, 相似度)] 列表"""
+    if isinstance(vectorstore, MmapVectorIndex):
+        return vectorstore.query(embeddings, k)
+    response = vectorstore._collection.query(query_embeddings=embeddings, n_results=k, include=["documents", "distances"])
+    # Chroma 默认返回平方 L2 距离，归一化向量下余弦相似度为 1 - d / 2
+    return [
+        [(doc, max(0.0, 1 - distance / 2)) for doc, distance in zip(docs, distances) if doc]
+        for docs, distances in zip(response["documents"], response["distances"])
+    ]
+
+def similarity_search_batch(vectorstore, queries, k=3):
+    """
+    批量检索，只返回文本
+    :return: 与 queries 一一对应的结果列表，每项为 key=value 文本列表
+    """
+    return [[doc for doc, _ in hits] for hits in similarity_search_batch_with_score(vectorstore, queries, k)]
+
+def similarity_search_batch_with_score(vectorstore, queries, k=3):
+    """
+    批量检索：一次嵌入请求计算所有查询的向量，再对索引执行一次多查询检索
+    :param vectorstore: langchain_chroma.Chroma 或 MmapVectorIndex 实例
+    :param queries: 查询字符串列表
+    :param k: 每个查询返回的结果数
+    :return: 与 queries 一一对应的结果列表，每项为 [(key=value 文本, 相似度)]
+    """
+    # 去除重复和空白的查询，避免重复嵌入
+    unique_queries = list(dict.fromkeys(q for q in queries if isinstance(q, str) and q.strip()))
+    if not unique_queries:
+        return [[] for _ in queries]
+
+    index_id, version = backend_version(vectorstore)
+    search_cache.check_version(index_id, version)
+
+    hits = {}
+    missing = []
+    for query in unique_queries:
+        docs = search_cache.get((index_id, query, k))
+        if docs is None:
+            missing.append(query)
+        else:
+            hits[query] = docs
+
+    if missing:
+        # 查询向量使用带缓存的嵌入模型，参考索引本身由不带缓存的模型构建
+        embeddings = get_embeddings().embed_documents(missing)
+        for query, docs in zip(missing, query_backend(vectorstore, embeddings, k)):
+            hits[query] = docs
+            search_cache.put((index_id, query, k), docs)
+    return [hits.get(q, []) for q in queries]
+
+def collect_candidates(vectorstore, queries, k, candidates=None):
+    """检索并合并为 参考文本 -> 最高相似度，供上下文构建使用"""
+    candidates = candidates if candidates is not None else {}
+    for hits in similarity_search_batch_with_score(vectorstore, queries, k):
+        for doc, score in hits:
+            if score > candidates.get(doc, -1.0):
+                candidates[doc] = score
+    return candidates
+
+def collect_string_values(data: dict):
+    """
+    收集字典中的所有字符串值，列表值会被展开
+    """
+    values = []
+    for value in data.values():
+        if isinstance(value, str):
+            values.append(value)
+        elif isinstance(value, list):
+            values.extend(item for item in value if isinstance(item, str))
+    return values
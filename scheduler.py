@@ -0,0 +1,61 @@
+import fnmatch
+
+from chunk_grouping import compose_entries
+from config import SCHEDULE_PRIORITY_PATTERNS, SCHEDULE_DEFAULT_PRIORITY, SCHEDULE_OUTPUT_WEIGHT, CHUNK_GROUPING
+from resources import get_embeddings
+from token_budget import estimate_tokens, estimate_entry_tokens, pack_chunks
+
+
+def key_priority(key: str):
+    """按配置的规则返回翻译键的优先级，数字越小越先翻译，第一个匹配的规则生效"""
+    for pattern, priority in SCHEDULE_PRIORITY_PATTERNS:
+        if fnmatch.fnmatchcase(key, pattern):
+            return priority
+    return SCHEDULE_DEFAULT_PRIORITY
+
+def chunk_priority(chunk: dict):
+    return min((key_priority(key) for key in chunk), default=SCHEDULE_DEFAULT_PRIORITY)
+
+def chunk_cost(chunk: dict, context_tokens=1500):
+    """
+    预估分块的处理耗时（以 token 计）：输入、参考上下文和输出，
+    输出逐个 token 生成，按 SCHEDULE_OUTPUT_WEIGHT 加权
+    """
+    prompt_tokens = context_tokens
+    completion_tokens = 0
+    for key, value in chunk.items():
+        prompt, completion = estimate_entry_tokens(key, value)
+        prompt_tokens += prompt
+        completion_tokens += completion
+    return prompt_tokens + completion_tokens * SCHEDULE_OUTPUT_WEIGHT
+
+def text_cost(text: str, context_tokens=1500):
+    """单段文本（如手册片段）的预估耗时，译文长度按原文估算"""
+    tokens = estimate_tokens(text)
+    return context_tokens + tokens + tokens * SCHEDULE_OUTPUT_WEIGHT
+
+def schedule(items, cost_fn, priority_fn=None):
+    """
+    最长处理时间优先 (LPT) 调度：先按优先级分组，同一优先级内预估耗时长的先开始，
+    避免最大的任务最后才开始，导致其他工作线程空闲时仍有一个任务在运行
+    """
+    return sorted(items, key=lambda item: (priority_fn(item) if priority_fn else 0, -cost_fn(item)))
+
+def pack_scheduled_chunks(d: dict, token_budget=8000, max_output_tokens=4000, context_tokens=1500, grouping=None, namespaces=None):
+    """
+    按优先级拆分后分别打包，保证高优先级的键不会和低优先级的键挤在同一个分块中，
+    每个优先级内按命名空间（可选嵌入聚类）排列条目，使同一分块的条目共享参考上下文，
+    再按优先级和预估耗时排序
+    :param grouping: none / namespace / embedding，默认使用 CHUNK_GROUPING
+    :param namespaces: 已知的 key -> 命名空间
+    """
+    grouping = grouping or CHUNK_GROUPING
+    embeddings = get_embeddings() if grouping == 'embedding' else None
+    groups = {}
+    for key, value in d.items():
+        groups.setdefault(key_priority(key), {})[key] = value
+    chunks = []
+    for priority in sorted(groups):
+        entries = compose_entries(groups[priority], grouping, namespaces, embeddings, token_budget - context_tokens)
+        chunks.extend(pack_chunks(entries, token_budget, max_output_tokens, context_tokens=context_tokens))
+    return schedule(chunks, lambda chunk: chunk_cost(chunk, context_tokens), chunk_priority)
@@ -0,0 +1,141 @@
+import re
+
+from config import TEMPLATE_SLOT_FILLERS, TEMPLATE_MIN_FAMILY
+from metrics import metrics
+from validation import CJK_PATTERN, check_value, make_validated
+
+# 模板中的槽位，形如 {name} 的占位符会被逐键校验检查，保证模型翻译模板时原样保留
+SLOT = '{slot}'
+TEMPLATE_KEY_SUFFIX = '#template'
+# 组合后两个汉字之间多余的空格，如模型输出 "{slot} 木板"
+CJK_SPACE_PATTERN = re.compile(rf'(?<={CJK_PATTERN.pattern})\s+(?={CJK_PATTERN.pattern})')
+
+
+def slot_pattern(fillers):
+    # 长的填充词优先匹配，Dark Oak 不会被拆成 Oak
+    alternatives = '|'.join(re.escape(filler) for filler in sorted(set(fillers), key=len, reverse=True))
+    return re.compile(rf'(?<![\w-])(?:{alternatives})(?![\w-])')
+
+def find_template_families(pending: dict, fillers=TEMPLATE_SLOT_FILLERS, min_family=TEMPLATE_MIN_FAMILY):
+    """
+    找出只有一个词不同的条目族，如 Oak Planks / Spruce Planks / Birch Planks -> {slot} Planks，
+    每个条目只归入最大的一个族，填充词少于 min_family 种的族不使用模板
+    :return: (模板 -> {key: 填充词}, 剩余的 key -> 原文)
+    """
+    pattern = slot_pattern(fillers)
+    candidates = {}
+    for key, value in pending.items():
+        if not isinstance(value, str) or SLOT in value:
+            continue
+        for match in pattern.finditer(value):
+            template = value[:match.start()] + SLOT + value[match.end():]
+            # 模板本身需要有可翻译的文本
+            if re.search(r'[A-Za-z]', template.replace(SLOT, '')):
+                candidates.setdefault(template, {})[key] = match.group()
+
+    families = {}
+    assigned = set()
+    for template, members in sorted(candidates.items(), key=lambda item: -len(item[1])):
+        members = {key: filler for key, filler in members.items() if key not in assigned}
+        if len(set(members.values())) >= min_family:
+            families[template] = members
+            assigned.update(members)
+    rest = {key: value for key, value in pending.items() if key not in assigned}
+    return families, rest
+
+
+class TemplateFactoring:
+    """
+    模板化翻译：条目族的模板只翻译一次，填充词优先使用翻译记忆，其余合并为一次小请求翻译，
+    在本地组合出每个条目的译文。组合结果同样经过逐键校验，模板或组合失败的条目退回单独翻译
+    """
+
+    def __init__(self, pending: dict, fillers=TEMPLATE_SLOT_FILLERS, min_family=TEMPLATE_MIN_FAMILY):
+        self.source = pending
+        self.min_family = min_family
+        self.families, self.rest = find_template_families(pending, fillers, min_family)
+        self.filler_translations = {}
+        self.templates = {}
+        self._composed = set()
+        self._fallback = {}
+
+    def resolve_fillers(self, translate, memory: dict, max_attempts=3):
+        """
+        翻译所有族用到的填充词，无法翻译的填充词对应的条目退回普通翻译
+        :param translate: 未包装校验的翻译函数 (key -> 原文)
+        :param memory: 英文 -> 中文 的翻译记忆
+        """
+        # 每个填充词附带最大的族中的一个条目作为上下文，如 Lead 是金属还是动词、Orange 是颜色还是水果
+        samples = {}
+        for members in self.families.values():
+            for key, filler in members.items():
+                samples.setdefault(filler, key)
+        for filler in samples:
+            zh_value = memory.get(filler)
+            if isinstance(zh_value, str) and CJK_PATTERN.search(zh_value):
+                self.filler_translations[filler] = zh_value
+        missing = {f'{key} | {self.source[key]}': filler for filler, key in samples.items() if filler not in self.filler_translations}
+        if missing:
+            failures = {}
+            validated, _ = make_validated(translate, None, failures, max_attempts)
+            try:
+                with metrics.span("template_filler_request", fillers=len(missing)):
+                    result = validated(missing)
+            except Exception as e:
+                # 填充词翻译失败时，相关的条目按普通条目翻译
+                print(f'⚠️ 模板填充词翻译失败，相关条目将单独翻译: {e}')
+                metrics.inc("template_filler_errors")
+                result = {}
+            self.filler_translations.update({missing[key]: value for key, value in result.items()
+                                             if key in missing and isinstance(value, str) and CJK_PATTERN.search(value)})
+        metrics.inc("template_fillers", len(samples))
+
+        families = {}
+        for template, members in self.families.items():
+            members = {key: filler for key, filler in members.items() if filler in self.filler_translations}
+            if len(set(members.values())) >= self.min_family:
+                families[template] = members
+        self.families = families
+        assigned = {key for members in families.values() for key in members}
+        self.rest = {key: value for key, value in self.source.items() if key not in assigned}
+        self.templates = {next(iter(members)) + TEMPLATE_KEY_SUFFIX: template for template, members in families.items()}
+        metrics.inc("template_families", len(families))
+
+    def template_entries(self):
+        """需要交给大模型翻译的模板，键为族中第一个条目的键加后缀，保留键名提供的上下文"""
+        return dict(self.templates)
+
+    def entry_count(self):
+        return sum(len(members) for members in self.families.values())
+
+    def compose(self, result: dict):
+        """
+        从分块结果中取出模板译文，组合出族内每个条目的译文并校验
+        :return: 通过校验的 key -> 中文
+        """
+        composed = {}
+        for template_key in [key for key in result if key in self.templates]:
+            template = self.templates[template_key]
+            template_zh = result.pop(template_key)
+            self._composed.add(template_key)
+            for key, filler in self.families[template].items():
+                value = CJK_SPACE_PATTERN.sub('', template_zh.replace(SLOT, self.filler_translations[filler]))
+                if check_value(self.source[key], value) is None:
+                    composed[key] = value
+                else:
+                    self._fallback[key] = self.source[key]
+        metrics.inc("template_composed", len(composed))
+        return composed
+
+    def fallback(self, failures: dict):
+        """
+        模板翻译失败（校验失败或分块失败）以及组合后校验失败的条目，从 failures 中移除模板的键
+        :return: 需要单独翻译的 key -> 原文
+        """
+        fallback = dict(self._fallback)
+        for template_key, template in self.templates.items():
+            failures.pop(template_key, None)
+            if template_key not in self._composed:
+                fallback.update({key: self.source[key] for key in self.families[template]})
+        metrics.inc("template_fallback", len(fallback))
+        return fallback
@@ -0,0 +1,57 @@
+import json
+
+
+def estimate_tokens(text: str):
+    """
+    粗略估算文本的 token 数：中日韩字符约 1 token/字，其余字符约 4 字符/token
+    """
+    cjk = sum(1 for ch in text if '⺀' <= ch <= '鿿' or '가' <= ch <= '힯' or '豈' <= ch <= '﫿')
+    return cjk + (len(text) - cjk + 3) // 4
+
+def estimate_entry_tokens(key, value):
+    """
+    估算单个条目的 (输入 token, 输出 token)
+    输出为键名加上译文，译文按原文的 1.5 倍估算
+    """
+    entry_text = json.dumps({key: value}, ensure_ascii=False)
+    value_text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    prompt_tokens = estimate_tokens(entry_text)
+    completion_tokens = estimate_tokens(json.dumps(key, ensure_ascii=False)) + estimate_tokens(value_text) * 3 // 2 + 4
+    return prompt_tokens, completion_tokens
+
+def pack_chunks(d: dict, token_budget=8000, max_output_tokens=4000, context_tokens=1500, max_entries=500):
+    """
+    按 token 预算打包分块，替代按条目数分块：
+    短文本的条目会被尽量装进同一个请求，长文本的条目少装一些，
+    单个超出预算的条目会被单独放在一个请求中
+    :param d: 待翻译的字典
+    :param token_budget: 每个请求输入加输出的 token 上限
+    :param max_output_tokens: 每个请求输出的 token 上限，避免输出被截断
+    :param context_tokens: 每个请求为参考上下文预留的 token 数
+    :param max_entries: 每个请求的最大条目数
+    :return: 生成器，每个元素是一个分块字典
+    """
+    token_budget = max(token_budget - context_tokens, 1)
+    chunk = {}
+    chunk_tokens = 0
+    chunk_output = 0
+    for key, value in d.items():
+        prompt_tokens, completion_tokens = estimate_entry_tokens(key, value)
+        entry_tokens = prompt_tokens + completion_tokens
+        if entry_tokens > token_budget or completion_tokens > max_output_tokens:
+            # 超大条目单独成块
+            print(f"条目 {key} 约 {entry_tokens} tokens，超出单个请求预算，单独翻译")
+            yield {key: value}
+            continue
+        if chunk and (chunk_tokens + entry_tokens > token_budget
+                      or chunk_output + completion_tokens > max_output_tokens
+                      or len(chunk) >= max_entries):
+            yield chunk
+            chunk = {}
+            chunk_tokens = 0
+            chunk_output = 0
+        chunk[key] = value
+        chunk_tokens += entry_tokens
+        chunk_output += completion_tokens
+    if chunk:
+        yield chunk
@@ -0,0 +1,261 @@
+import io
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ftb_snbt_lib as slib
+
+from ai_translate import build_dict_translator, build_document_graph, translate_document
+from config import SERVER_HOST, SERVER_PORT, SERVER_BATCH_WINDOW, SERVER_MAX_WORKERS, AE2_SEGMENT_CACHE_FILE, openai_llm_model, \
+    CHUNK_TOKEN_BUDGET, CHUNK_MAX_OUTPUT_TOKENS, CONTEXT_TOKEN_BUDGET, VALIDATION_MAX_ATTEMPTS
+from ftbquest_translate import dict_to_slib, flatten_quest_lang
+from markdown_segment import split_markdown, restore_whitespace, segment_key, SegmentCache
+from metrics import metrics
+from token_budget import pack_chunks
+from validation import make_validated
+
+
+class RequestBatcher:
+    """
+    动态批处理：在 window 秒内到达的多个小请求合并为同一批，相同的原文只翻译一次，
+    按 token 预算切分后交给翻译函数，结果再拆分回各个请求
+    """
+
+    def __init__(self, translate, window=0.05, max_workers=8):
+        self.translate = translate
+        self.window = window
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._thread = threading.Thread(target=self._collect, name='request-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, entries: dict) -> Future:
+        """
+        提交 key -> 原文 (字符串或字符串列表)
+        :return: Future，结果为 (key -> 译文, key -> 校验失败原因)
+        """
+        future = Future()
+        self._queue.put((future, entries))
+        return future
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while (timeout := deadline - time.monotonic()) > 0:
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            metrics.inc("server_batches")
+            metrics.set_gauge("server_batch_requests", len(batch))
+            self._executor.submit(self._run, batch)
+
+    def _translate(self, entries: dict):
+        failures = {}
+        translate, _ = make_validated(self.translate, None, failures, VALIDATION_MAX_ATTEMPTS)
+        results = {}
+        for chunk in pack_chunks(entries, CHUNK_TOKEN_BUDGET, CHUNK_MAX_OUTPUT_TOKENS, context_tokens=CONTEXT_TOKEN_BUDGET):
+            results.update(translate(chunk))
+        return results, failures
+
+    def _run(self, batch):
+        # 合并所有请求，相同的原文共用一个键
+        merged = {}
+        value_keys = {}
+        owners = []
+        for future, entries in batch:
+            mapping = {}
+            for key, value in entries.items():
+                value_id = json.dumps(value, ensure_ascii=False)
+                merged_key = value_keys.get(value_id)
+                if merged_key is None:
+                    merged_key = key
+                    while merged_key in merged:
+                        merged_key += '#'
+                    merged[merged_key] = value
+                    value_keys[value_id] = merged_key
+                mapping[key] = merged_key
+            owners.append((future, mapping))
+
+        try:
+            with metrics.span("server_batch", entries=len(merged), requests=len(batch)):
+                results, failures = self._translate(merged)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][0].set_exception(e)
+                return
+            # 合并的批次出错时逐个请求重新翻译，一个请求的错误不影响同一批的其他请求
+            metrics.inc("server_batch_splits")
+            for future, entries in batch:
+                try:
+                    future.set_result(self._translate(entries))
+                except Exception as request_error:
+                    future.set_exception(request_error)
+            return
+
+        for future, mapping in owners:
+            translated = {key: results[merged_key] for key, merged_key in mapping.items() if merged_key in results}
+            failed = {key: failures[merged_key] for key, merged_key in mapping.items() if merged_key in failures}
+            future.set_result((translated, failed))
+
+
+class TranslateService:
+    """
+    常驻的翻译服务，参考索引、术语表和客户端只在启动时加载一次，
+    字符串、JSON 和 SNBT 共用动态批处理，markdown 按片段并发翻译并使用片段缓存
+    """
+
+    def __init__(self, db_dir="chroma", window=0.05, max_workers=8):
+        translate, _ = build_dict_translator(db_dir)
+        self.batcher = RequestBatcher(translate, window, max_workers)
+        self.document_graph = build_document_graph(db_dir)
+        self.segment_cache = SegmentCache(AE2_SEGMENT_CACHE_FILE)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def translate_entries(self, entries: dict):
+        return self.batcher.submit(entries).result()
+
+    def translate_string(self, text: str, key='text'):
+        translated, failed = self.translate_entries({key: text})
+        return translated.get(key), failed.get(key)
+
+    def translate_markdown(self, document: str):
+        segments = split_markdown(document)
+
+        def translate_segment(segment):
+            text, need_translate = segment
+            if not need_translate:
+                return text
+            cache_key = segment_key(text, openai_llm_model)
+            cached = self.segment_cache.get(cache_key)
+            if cached is None:
+                cached = translate_document(text, graph=self.document_graph)
+                self.segment_cache.put(cache_key, cached)
+            else:
+                metrics.inc("segment_cache_hits")
+            return restore_whitespace(text, cached)
+
+        return ''.join(self._executor.map(translate_segment, segments))
+
+    def translate_snbt(self, content: str):
+        tag = slib.load(io.StringIO(content))
+        output = {key: list(map(str, value)) if isinstance(value, list) else str(value) for key, value in tag.items()}
+        entries = {}
+        for key, index, text in flatten_quest_lang(tag):
+            if text.strip():
+                entries[key if index is None else f'{key}[{index}]'] = (key, index, text)
+        translated, failed = self.translate_entries({entry_key: text for entry_key, (_, _, text) in entries.items()})
+        for entry_key, value in translated.items():
+            key, index, _ = entries[entry_key]
+            if index is None:
+                output[key] = value
+            else:
+                output[key][index] = value
+        result = io.StringIO()
+        slib.dump(dict_to_slib(output), result)
+        return result.getvalue(), failed
+
+
+def make_handler(service: TranslateService):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_body(self, status, body: bytes, content_type='application/json; charset=utf-8'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_json(self, status, payload):
+            self.send_body(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+
+        def do_GET(self):
+            if self.path == '/health':
+                self.send_json(200, {'status': 'ok'})
+            elif self.path == '/metrics':
+                self.send_body(200, metrics.to_prometheus().encode('utf-8'), 'text/plain; version=0.0.4')
+            else:
+                self.send_json(404, {'error': f'未知路径: {self.path}'})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                request = json.loads(self.rfile.read(length) or b'{}')
+            except (ValueError, json.JSONDecodeError) as e:
+                self.send_json(400, {'error': f'请求不是有效的 JSON: {e}'})
+                return
+            routes = {
+                '/translate/string': self.translate_string,
+                '/translate/json': self.translate_json,
+                '/translate/markdown': self.translate_markdown,
+                '/translate/snbt': self.translate_snbt,
+            }
+            route = routes.get(self.path)
+            if route is None:
+                self.send_json(404, {'error': f'未知路径: {self.path}'})
+                return
+            metrics.inc("server_requests")
+            try:
+                with metrics.span("server_request", path=self.path):
+                    status, payload = route(request)
+            except Exception as e:
+                status, payload = 500, {'error': str(e)}
+            self.send_json(status, payload)
+
+        def translate_string(self, request):
+            if not isinstance(request.get('text'), str):
+                return 400, {'error': '缺少字符串字段 text'}
+            # 可选的 key 作为上下文，如 item.ae2.fluix_crystal
+            text, reason = service.translate_string(request['text'], request.get('key') or 'text')
+            return (200, {'text': text}) if text is not None else (422, {'error': f'翻译失败: {reason}'})
+
+        def translate_json(self, request):
+            entries = request.get('entries')
+            if not isinstance(entries, dict):
+                return 400, {'error': '缺少对象字段 entries'}
+            invalid = [key for key, value in entries.items()
+                       if not isinstance(value, str) and not (isinstance(value, list) and all(isinstance(item, str) for item in value))]
+            if invalid:
+                return 400, {'error': f'entries 的值必须是字符串或字符串列表: {invalid[:10]}'}
+            translated, failed = service.translate_entries(entries)
+            return 200, {'entries': translated, 'failed': failed}
+
+        def translate_markdown(self, request):
+            if not isinstance(request.get('document'), str):
+                return 400, {'error': '缺少字符串字段 document'}
+            return 200, {'document': service.translate_markdown(request['document'])}
+
+        def translate_snbt(self, request):
+            if not isinstance(request.get('snbt'), str):
+                return 400, {'error': '缺少字符串字段 snbt'}
+            snbt, failed = service.translate_snbt(request['snbt'])
+            return 200, {'snbt': snbt, 'failed': failed}
+
+    return Handler
+
+def serve(host=SERVER_HOST, port=SERVER_PORT, db_dir="chroma", window=SERVER_BATCH_WINDOW, max_workers=SERVER_MAX_WORKERS):
+    start = time.perf_counter()
+    service = TranslateService(db_dir, window, max_workers)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    print(f'翻译服务已启动: http://{host}:{port}，加载耗时 {time.perf_counter() - start:.1f} 秒')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        metrics.export()
+
+
+if __name__ == '__main__':
+    serve()
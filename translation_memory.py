@@ -0,0 +1,29 @@
+def dedup_values(pending: dict):
+    """
+    合并相同的英文原文，每个原文只保留一个代表键发送给大模型
+    :return: (代表键 -> 英文, 英文 -> 所有使用该原文的键)
+    """
+    unique = {}
+    groups = {}
+    for key, value in pending.items():
+        if value in groups:
+            groups[value].append(key)
+        else:
+            groups[value] = [key]
+            unique[key] = value
+    return unique, groups
+
+def fan_out(result: dict, unique: dict, groups: dict):
+    """
+    将代表键的翻译结果分发回所有相同原文的键
+    """
+    expanded = {}
+    for key, value in result.items():
+        source = unique.get(key)
+        if source is None:
+            # 模型返回了未知的键，原样保留
+            expanded[key] = value
+            continue
+        for same_key in groups[source]:
+            expanded[same_key] = value
+    return expanded
@@ -0,0 +1,264 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+
+from journal import write_text_atomic
+
+# 资源包格式版本，1.21 ~ 1.21.1 为 34
+RESOURCE_PACK_FORMAT = 34
+
+
+def iter_lang_files(directory):
+    """遍历语言文件目录，返回 (命名空间, key -> 文本)，只保留字符串值"""
+    if not os.path.isdir(directory):
+        return
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        namespace = filename.split('.', 1)[0]
+        with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                print(f"解析文件 {filename} 时出错: {e}")
+                continue
+        yield namespace, {key: value for key, value in data.items() if isinstance(value, str)}
+
+
+class TranslationStore:
+    """
+    所有语言条目的 SQLite 存储 (WAL 模式)，代替 work 目录下的合并 JSON 文件：
+    每个条目记录范围 (reference 参考 / pack 整合包)、键、命名空间、原文、译文、来源和状态，
+    各步骤只查询和更新需要的行，最后再导出为 JSON 或资源包
+    来源: minecraft, mod, cfpa, manual (exist_translated.json), memory (翻译记忆), previous (上个版本发布的译文), llm
+    状态: untranslated, translated, failed
+    """
+
+    def __init__(self, db_file):
+        db_dir = os.path.dirname(db_file)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                scope TEXT NOT NULL,
+                key TEXT NOT NULL,
+                namespace TEXT NOT NULL,
+                source TEXT NOT NULL,
+                target TEXT,
+                provenance TEXT,
+                status TEXT NOT NULL DEFAULT 'untranslated',
+                note TEXT,
+                generation INTEGER NOT NULL DEFAULT 0,
+                updated REAL NOT NULL,
+                PRIMARY KEY (scope, key)
+            );
+            CREATE INDEX IF NOT EXISTS entries_status ON entries (scope, status);
+            CREATE INDEX IF NOT EXISTS entries_source ON entries (scope, source);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._conn.commit()
+
+    def get_meta(self, name):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, str(value)))
+
+    def import_sources(self, scope, en_dir, zh_dir, provenance_of=lambda namespace: 'mod'):
+        """
+        从提取出的语言文件目录导入原文和自带的译文，每个文件的条目直接写入数据库，不在内存中合并：
+        原文未变化的条目保留已有译文，原文变化的条目重置为未翻译，不再存在的键被删除，
+        手动译文 (manual) 不会被语言文件覆盖
+        :param provenance_of: 命名空间 -> 自带译文的来源
+        :return: 导入的原文条目数
+        """
+        now = time.time()
+        count = 0
+        with self._lock, self._conn:
+            generation = int(self._conn.execute("SELECT COALESCE(MAX(generation), 0) + 1 FROM entries WHERE scope = ?", (scope,)).fetchone()[0])
+            # 相同的键在多个文件中出现时，与逐个文件合并一致，后出现的原文生效，命名空间保留第一次出现的文件
+            for namespace, data in iter_lang_files(en_dir):
+                self._conn.executemany("""
+                    INSERT INTO entries (scope, key, namespace, source, status, generation, updated)
+                    VALUES (?, ?, ?, ?, 'untranslated', ?, ?)
+                    ON CONFLICT (scope, key) DO UPDATE SET
+                        namespace = CASE WHEN entries.generation = excluded.generation THEN entries.namespace ELSE excluded.namespace END,
+                        target = CASE WHEN entries.source = excluded.source THEN entries.target END,
+                        provenance = CASE WHEN entries.source = excluded.source THEN entries.provenance END,
+                        status = CASE WHEN entries.source = excluded.source THEN entries.status ELSE 'untranslated' END,
+                        note = CASE WHEN entries.source = excluded.source THEN entries.note END,
+                        source = excluded.source,
+                        generation = excluded.generation,
+                        updated = CASE WHEN entries.source = excluded.source THEN entries.updated ELSE excluded.updated END
+                """, [(scope, key, namespace, value, generation, now) for key, value in data.items()])
+                count += len(data)
+            self._conn.execute("DELETE FROM entries WHERE scope = ? AND generation < ?", (scope, generation))
+
+            # 语言文件自带的译文每次重新导入，jar 中移除的译文会恢复为未翻译
+            self._conn.execute("""
+                UPDATE entries SET target = NULL, provenance = NULL, status = 'untranslated', updated = ?
+                WHERE scope = ? AND provenance IN ('minecraft', 'mod', 'cfpa')
+            """, (now, scope))
+            for namespace, data in iter_lang_files(zh_dir):
+                self._apply_targets(scope, data, provenance_of(namespace), now)
+            self._set_meta(f'{scope}_import', f'{generation}:{now}')
+        print(f"导入 {scope}: {count} 条原文")
+        return count
+
+    def import_targets(self, scope, targets: dict, provenance):
+        """导入额外的译文，如 exist_translated.json 中手动翻译的 key -> 中文"""
+        with self._lock, self._conn:
+            self._apply_targets(scope, targets, provenance, time.time())
+
+    def _apply_targets(self, scope, targets: dict, provenance, now):
+        # 语言文件中与原文相同的译文视为未翻译，大模型保留原样的专有名词视为已翻译
+        self._conn.executemany("""
+            UPDATE entries SET target = ?, provenance = ?, status = 'translated', note = NULL, updated = ?
+            WHERE scope = ? AND key = ? AND (source != ? OR ? = 'llm') AND (provenance IS NULL OR provenance != 'manual' OR ? = 'manual')
+        """, [(value, provenance, now, scope, key, value, provenance, provenance) for key, value in targets.items() if isinstance(value, str)])
+
+    def fill_targets(self, scope, targets: dict, provenance):
+        """
+        只为还没有译文的条目填充译文，已有译文（模组自带、手动等）的条目保持不变
+        :return: 填充的条目数
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.executemany("""
+                UPDATE entries SET target = ?, provenance = ?, status = 'translated', note = NULL, updated = ?
+                WHERE scope = ? AND key = ? AND status != 'translated'
+            """, [(value, provenance, now, scope, key) for key, value in targets.items() if isinstance(value, str)])
+            return cursor.rowcount
+
+    def apply_memory(self, scope, memory_scope='reference'):
+        """
+        翻译记忆：用参考范围中相同原文的译文填充未翻译的条目，在数据库中一次完成
+        :return: 命中的条目数
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute("""
+                UPDATE entries SET
+                    target = (
+                        SELECT memory.target FROM entries AS memory
+                        WHERE memory.scope = ? AND memory.source = entries.source AND memory.status = 'translated'
+                        ORDER BY memory.rowid DESC LIMIT 1
+                    ),
+                    provenance = 'memory', status = 'translated', note = NULL, updated = ?
+                WHERE scope = ? AND status != 'translated' AND EXISTS (
+                    SELECT 1 FROM entries AS memory
+                    WHERE memory.scope = ? AND memory.source = entries.source AND memory.status = 'translated'
+                )
+            """, (memory_scope, time.time(), scope, memory_scope))
+            return cursor.rowcount
+
+    def sources(self, scope):
+        """所有条目的 key -> 原文"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT key, source FROM entries WHERE scope = ? ORDER BY rowid", (scope,)).fetchall())
+
+    def pending_namespaces(self, scope):
+        """未翻译条目的 key -> 命名空间，用于按命名空间组成分块"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT key, namespace FROM entries WHERE scope = ? AND status != 'translated'", (scope,)).fetchall())
+
+    def pending(self, scope):
+        """未翻译和上次失败的 key -> 原文"""
+        with self._lock:
+            rows = self._conn.execute("SELECT key, source FROM entries WHERE scope = ? AND status != 'translated' ORDER BY rowid", (scope,))
+            return dict(rows.fetchall())
+
+    def save_translations(self, scope, translations: dict, provenance='llm'):
+        """写入一批译文，每批一个事务，中断后已写入的译文不会丢失"""
+        with self._lock, self._conn:
+            self._apply_targets(scope, translations, provenance, time.time())
+
+    def mark_failed(self, scope, failures: dict):
+        """记录校验失败的 key -> 原因，重新运行时会再次翻译"""
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE entries SET status = 'failed', note = ?, updated = ? WHERE scope = ? AND key = ? AND status != 'translated'",
+                                   [(reason, time.time(), scope, key) for key, reason in failures.items()])
+
+    def iter_translated(self, scope, exclude_provenance=()):
+        """按命名空间和键的顺序遍历已翻译的 (命名空间, 键, 原文, 译文)"""
+        sql = "SELECT namespace, key, source, target FROM entries WHERE scope = ? AND status = 'translated'"
+        params = [scope]
+        if exclude_provenance:
+            sql += f" AND provenance NOT IN ({', '.join('?' * len(exclude_provenance))})"
+            params += list(exclude_provenance)
+        with self._lock:
+            cursor = self._conn.execute(sql + " ORDER BY namespace, key", params)
+        # 分批读取，导出时内存占用与条目总数无关
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            yield from rows
+
+    def translation_map(self, scope):
+        """原文 -> 译文，相同原文使用最后导入的译文，用于术语表、翻译记忆文件和向量索引"""
+        with self._lock:
+            rows = self._conn.execute("SELECT source, target FROM entries WHERE scope = ? AND status = 'translated' ORDER BY rowid", (scope,))
+            return dict(rows.fetchall())
+
+    def stats(self, scope):
+        with self._lock:
+            status = dict(self._conn.execute("SELECT status, COUNT(*) FROM entries WHERE scope = ? GROUP BY status", (scope,)).fetchall())
+            provenance = dict(self._conn.execute("SELECT COALESCE(provenance, '-'), COUNT(*) FROM entries WHERE scope = ? GROUP BY provenance", (scope,)).fetchall())
+        return {'status': status, 'provenance': provenance}
+
+    def export_map(self, scope, output_file):
+        """导出 原文 -> 译文 的映射文件"""
+        output_dir = os.path.dirname(output_file)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        write_text_atomic(output_file, json.dumps(self.translation_map(scope), ensure_ascii=False, indent=2))
+        print(f"✅ 翻译映射已保存至: {output_file}")
+
+    def export_namespaces(self, scope, output_dir, lang='zh_cn', exclude_provenance=('minecraft', 'mod', 'cfpa')):
+        """
+        按命名空间导出 output_dir/<命名空间>/lang/zh_cn.json，默认不包含模组自带的译文，
+        每次只在内存中保留一个命名空间
+        """
+        for namespace, translations in self._group_by_namespace(scope, exclude_provenance):
+            out_file = os.path.join(output_dir, namespace, 'lang', f'{lang}.json')
+            os.makedirs(os.path.dirname(out_file), exist_ok=True)
+            write_text_atomic(out_file, json.dumps(translations, ensure_ascii=False, indent=4))
+
+    def export_resource_pack(self, scope, output_file, lang='zh_cn', description='AI 翻译', exclude_provenance=('minecraft', 'mod', 'cfpa')):
+        """导出为可以直接加载的资源包 zip"""
+        output_dir = os.path.dirname(output_file)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        tmp_file = output_file + '.tmp'
+        with zipfile.ZipFile(tmp_file, 'w', zipfile.ZIP_DEFLATED) as pack:
+            pack.writestr('pack.mcmeta', json.dumps({'pack': {'pack_format': RESOURCE_PACK_FORMAT, 'description': description}}, ensure_ascii=False, indent=2))
+            for namespace, translations in self._group_by_namespace(scope, exclude_provenance):
+                pack.writestr(f'assets/{namespace}/lang/{lang}.json', json.dumps(translations, ensure_ascii=False, indent=4))
+        os.replace(tmp_file, output_file)
+        print(f"✅ 资源包已保存至: {output_file}")
+
+    def _group_by_namespace(self, scope, exclude_provenance):
+        namespace = None
+        translations = {}
+        for row_namespace, key, source, target in self.iter_translated(scope, exclude_provenance):
+            if row_namespace != namespace:
+                if translations:
+                    yield namespace, translations
+                namespace, translations = row_namespace, {}
+            translations[key] = target
+        if translations:
+            yield namespace, translations
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
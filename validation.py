@@ -0,0 +1,95 @@
+import re
+from collections import Counter
+
+from metrics import metrics
+
+# §a 和 &a 颜色格式代码，前面是字母或数字的 & 是普通英文（R&D、Q&A），不算格式代码，术语匹配共用
+FORMAT_CODE = r"§[0-9a-fk-or]|(?<!\w)&[0-9a-fk-or]"
+FORMAT_CODE_PATTERN = re.compile(FORMAT_CODE, re.IGNORECASE)
+# Java/C 格式化占位符 (%s, %1$s, %d, %.2f, %%)、{0} / {name} 占位符和颜色格式代码
+PLACEHOLDER_PATTERN = re.compile(r"%(?:\d+\$)?[-#+0,(]*\d*(?:\.\d+)?[sdfxeEgGcbhon%]|\{[\w.:-]*}|" + FORMAT_CODE, re.IGNORECASE)
+CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿]")
+ENGLISH_WORD_PATTERN = re.compile(r"[A-Za-z]{3,}")
+
+
+def placeholders(text: str):
+    return Counter(match.group().lower() for match in PLACEHOLDER_PATTERN.finditer(text))
+
+def check_text(source: str, translated):
+    """
+    检查单条译文，返回失败原因，通过时返回 None
+    """
+    if not isinstance(source, str):
+        # 非字符串的原文（数字、布尔值、嵌套对象）不做检查
+        return None
+    if not isinstance(translated, str):
+        return 'type'
+    if placeholders(source) != placeholders(translated):
+        return 'placeholder'
+    stripped = PLACEHOLDER_PATTERN.sub(' ', source)
+    if len(ENGLISH_WORD_PATTERN.findall(stripped)) >= 2 and not CJK_PATTERN.search(translated):
+        return 'untranslated'
+    return None
+
+def check_value(source, translated):
+    if isinstance(source, list):
+        if not isinstance(translated, list) or len(translated) != len(source):
+            return 'type'
+        for source_item, translated_item in zip(source, translated):
+            reason = check_text(source_item, translated_item) if isinstance(source_item, str) and source_item.strip() else None
+            if reason:
+                return reason
+        return None
+    return check_text(source, translated)
+
+def validate_translations(source: dict, result: dict):
+    """
+    逐个键检查模型输出：键存在、占位符和格式代码保留、不是原样的英文
+    :return: (通过的 key -> 译文, 失败的 key -> 原因)
+    """
+    passed = {}
+    failed = {}
+    for key, source_value in source.items():
+        if not isinstance(result, dict) or key not in result:
+            failed[key] = 'missing'
+            continue
+        reason = check_value(source_value, result[key])
+        if reason:
+            failed[key] = reason
+        else:
+            passed[key] = result[key]
+    return passed, failed
+
+def make_validated(translate, atranslate, failures: dict, max_attempts=3):
+    """
+    为翻译函数加上逐键校验，只把失败的键组成小批次重新翻译，最多尝试 max_attempts 次，
+    最终仍失败的键和原因记录到 failures 中，不会出现在返回结果里
+    """
+
+    def run_sync(chunk: dict):
+        passed = {}
+        pending = chunk
+        for attempt in range(max_attempts):
+            good, bad = validate_translations(pending, translate(pending))
+            passed.update(good)
+            if not bad:
+                return passed
+            metrics.inc("validation_retries" if attempt < max_attempts - 1 else "validation_failures", len(bad))
+            pending = {key: chunk[key] for key in bad}
+        failures.update(bad)
+        return passed
+
+    async def run_async(chunk: dict):
+        passed = {}
+        pending = chunk
+        for attempt in range(max_attempts):
+            good, bad = validate_translations(pending, await atranslate(pending))
+            passed.update(good)
+            if not bad:
+                return passed
+            metrics.inc("validation_retries" if attempt < max_attempts - 1 else "validation_failures", len(bad))
+            pending = {key: chunk[key] for key in bad}
+        failures.update(bad)
+        return passed
+
+    return run_sync, run_async
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+# 导出的内存映射索引包含的文件
+MMAP_INDEX_FILES = ("meta.json", "vectors.npy", "scales.npy", "documents.json")
+
+
+def mmap_index_meta(index_dir):
+    """导出的索引元数据 (dtype, count, version)，任何一个文件缺失时返回 None"""
+    if not all(os.path.exists(os.path.join(index_dir, name)) for name in MMAP_INDEX_FILES):
+        return None
+    with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def mmap_index_stale(index_dir, dtype):
+    """导出的文件缺失或量化类型与配置不一致时需要重新导出"""
+    meta = mmap_index_meta(index_dir)
+    return meta is None or meta.get("dtype") != dtype
+
+def export_vector_index(vectorstore, index_dir, dtype="float16", page_size=4096):
+    """
+    将 Chroma 中的参考向量导出为内存映射的矩阵文件：
+    vectors.npy 为归一化后的向量矩阵 (float16 或 int8 量化)，
+    int8 时 scales.npy 保存每行的缩放系数，documents.json 保存行号对应的 key=value 文本
+    """
+    collection = vectorstore._collection
+    count = collection.count()
+    os.makedirs(index_dir, exist_ok=True)
+    tmp_vectors_file = os.path.join(index_dir, "vectors.tmp.npy")
+
+    vectors = None
+    scales = np.ones(count, dtype=np.float32)
+    documents = []
+    # 版本为导出内容（文本和向量）的哈希，内容不变时重新导出不会让已加载的索引和检索缓存失效
+    content_hash = hashlib.sha1(dtype.encode("utf-8"))
+    for offset in range(0, count, page_size):
+        page = collection.get(include=["embeddings", "documents"], limit=page_size, offset=offset)
+        embeddings = np.array(page["embeddings"], dtype=np.float32)
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(tmp_vectors_file, mode="w+", dtype=np.int8 if dtype == "int8" else np.float16, shape=(count, embeddings.shape[1]))
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings /= np.maximum(norms, 1e-12)
+        rows = slice(offset, offset + len(embeddings))
+        if dtype == "int8":
+            row_scales = np.maximum(np.abs(embeddings).max(axis=1), 1e-12) / 127
+            vectors[rows] = np.round(embeddings / row_scales[:, None]).astype(np.int8)
+            scales[rows] = row_scales
+        else:
+            vectors[rows] = embeddings.astype(np.float16)
+        documents.extend(page["documents"])
+        content_hash.update(json.dumps(page["documents"], ensure_ascii=False).encode("utf-8"))
+        content_hash.update(vectors[rows].tobytes())
+
+    if vectors is None:
+        print("向量索引为空，跳过导出")
+        return
+    vectors.flush()
+    del vectors
+    os.replace(tmp_vectors_file, os.path.join(index_dir, "vectors.npy"))
+    np.save(os.path.join(index_dir, "scales.npy"), scales)
+    with open(os.path.join(index_dir, "documents.json"), "w", encoding="utf-8") as f:
+        json.dump(documents, f, ensure_ascii=False)
+    with open(os.path.join(index_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"dtype": dtype, "count": len(documents), "version": content_hash.hexdigest()}, f)
+    print(f"✅ 向量矩阵已导出: {index_dir} ({len(documents)} 条, {dtype})")
+
+
+class MmapVectorIndex:
+    """
+    内存映射的向量索引，使用 NumPy 对整批查询做余弦相似度 top-k 检索，
+    矩阵只映射不复制，多个线程和进程共享同一份页缓存
+    """
+
+    def __init__(self, index_dir, embeddings, block_size=65536):
+        self.index_dir = index_dir
+        self.embeddings = embeddings
+        self.block_size = block_size
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.id = index_dir
+        self.version = meta["version"]
+        self.vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(index_dir, "scales.npy"), mmap_mode="r")
+        with open(os.path.join(index_dir, "documents.json"), "r", encoding="utf-8") as f:
+            self.documents = json.load(f)
+
+    def query(self, query_embeddings, k=3):
+        """
+        批量检索
+        :return: 与查询一一对应的 [(key=value 文本, 相似度)] 列表，按相似度降序
+        """
+        if not self.documents:
+            return [[] for _ in query_embeddings]
+        queries = np.array(query_embeddings, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        k = min(k, len(self.documents))
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self.documents), self.block_size):
+            block = self.vectors[start:start + self.block_size].astype(np.float32)
+            scores = queries @ block.T
+            if self.vectors.dtype == np.int8:
+                scores *= self.scales[start:start + self.block_size]
+            block_k = min(k, scores.shape[1])
+            top = np.argpartition(-scores, block_k - 1, axis=1)[:, :block_k]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_ids = np.concatenate([best_ids, top + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_ids = np.take_along_axis(best_ids, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        results = []
+        for row_ids, row_scores in zip(np.take_along_axis(best_ids, order, axis=1), np.take_along_axis(best_scores, order, axis=1)):
+            results.append([(self.documents[i], float(score)) for i, score in zip(row_ids, row_scores)])
+        return results
+
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def load_mmap_index(index_dir, embeddings):
+    """进程内共享同一个索引实例，导出的版本变化后重新加载"""
+    with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+        version = json.load(f)["version"]
+    with _index_lock:
+        index = _indexes.get(index_dir)
+        if index is None or index.version != version:
+            index = MmapVectorIndex(index_dir, embeddings)
+            _indexes[index_dir] = index
+        return index